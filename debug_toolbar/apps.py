@@ -9,6 +9,10 @@ from django.middleware.gzip import GZipMiddleware
 from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 
+from debug_toolbar import settings as dt_settings
+from debug_toolbar.budgets import (
+    BUDGET_METRICS, get_unknown_metrics, is_valid_limit,
+)
 from debug_toolbar.middleware import DebugToolbarMiddleware
 
 
@@ -60,6 +64,41 @@ def check_middleware(app_configs, **kwargs):
     return errors
 
 
+@register
+def check_budgets(app_configs, **kwargs):
+    errors = []
+    budgets = dt_settings.get_config()['BUDGETS']
+    for url_name, budget in sorted(budgets.items()):
+        if not isinstance(budget, dict):
+            errors.append(
+                Error(
+                    "The budget of %r in DEBUG_TOOLBAR_CONFIG['BUDGETS'] isn't "
+                    "a dict." % url_name,
+                    hint="Use a dict of metrics and limits, e.g. "
+                    "{'sql_queries': 10}.",
+                )
+            )
+            continue
+        unknown = get_unknown_metrics(budget)
+        if unknown:
+            errors.append(
+                Error(
+                    "The budget of %r in DEBUG_TOOLBAR_CONFIG['BUDGETS'] has "
+                    "unknown metrics: %s." % (url_name, ', '.join(unknown)),
+                    hint="Choose from: %s." % ', '.join(BUDGET_METRICS),
+                )
+            )
+        for metric, limit in sorted(budget.items()):
+            if metric in BUDGET_METRICS and not is_valid_limit(limit):
+                errors.append(
+                    Error(
+                        "The %s limit of %r in DEBUG_TOOLBAR_CONFIG['BUDGETS'] "
+                        "isn't a number." % (metric, url_name),
+                    )
+                )
+    return errors
+
+
 def is_middleware_class(middleware_class, middleware_path):
     try:
         middleware_cls = import_string(middleware_path)
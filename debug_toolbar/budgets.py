@@ -0,0 +1,81 @@
+"""
+Check the stats collected by the panels against per-URL budgets.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict
+
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+
+from debug_toolbar import settings as dt_settings
+
+# Each metric is measured from the stats of a panel. Times are in ms.
+BUDGET_METRICS = OrderedDict([
+    ('sql_queries', ('SQLPanel', _("SQL queries"),
+                     lambda stats: len(stats.get('queries', [])))),
+    ('sql_time', ('SQLPanel', _("SQL time (ms)"),
+                  lambda stats: stats.get('sql_time'))),
+    ('cache_calls', ('CachePanel', _("Cache calls"),
+                     lambda stats: stats.get('total_calls'))),
+    ('templates', ('TemplatesPanel', _("Templates rendered"),
+                   lambda stats: len(stats.get('templates', [])))),
+    ('total_time', ('TimerPanel', _("Total time (ms)"),
+                    lambda stats: stats.get('total_time'))),
+])
+
+
+def get_budget(request):
+    """
+    Return the budget configured in ``BUDGETS`` for the URL name of
+    ``request``, or ``None``.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return dt_settings.get_config()['BUDGETS'].get(match.view_name)
+
+
+def check_budget(toolbar, budget):
+    """
+    Return the metrics of ``budget`` that the stats of ``toolbar`` exceed.
+
+    Each item is a dict with the ``metric``, its ``label``, the ``panel_id``
+    that measures it, the measured ``value`` and the ``limit``. Metrics of
+    disabled panels, unknown metrics and invalid limits aren't checked, the
+    system checks report them.
+    """
+    violations = []
+    if not isinstance(budget, dict):
+        return violations
+    for metric, (panel_id, label, measure) in BUDGET_METRICS.items():
+        if not is_valid_limit(budget.get(metric)):
+            continue
+        try:
+            panel = toolbar.get_panel_by_id(panel_id)
+        except KeyError:
+            continue
+        if not panel.enabled:
+            continue
+        value = measure(panel.get_stats())
+        if value is not None and value > budget[metric]:
+            violations.append({
+                'metric': metric,
+                'label': label,
+                'panel_id': panel_id,
+                'value': value,
+                'limit': budget[metric],
+            })
+    return violations
+
+
+def get_unknown_metrics(budget):
+    """
+    Return the sorted keys of ``budget`` that aren't in ``BUDGET_METRICS``.
+    """
+    return sorted(set(budget) - set(BUDGET_METRICS))
+
+
+def is_valid_limit(limit):
+    return isinstance(limit, six.integer_types + (float,)) and not isinstance(limit, bool)
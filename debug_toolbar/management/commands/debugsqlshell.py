@@ -1,24 +1,124 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
-from time import time
+from collections import OrderedDict
 
 import sqlparse
-# 'debugsqlshell' is the same as the 'shell'.
-from django.core.management.commands.shell import Command  # noqa
+from django.core.management.commands import shell
 from django.db.backends import utils as db_backends_utils
+from django.utils.six.moves import builtins
+
+from debug_toolbar.panels.sql.utils import (
+    explain_query, fingerprint_sql, get_plan_tree,
+)
+from debug_toolbar.utils import timer
+
+# Statistics per fingerprint, for the queries run in the shell.
+query_stats = OrderedDict()
+
+
+def sqlstats(reset=False):
+    """
+    Print the number of queries, their total and maximum time, for each
+    statement run in the shell, slowest first. Clear them if ``reset``.
+    """
+    if query_stats:
+        print('%6s %10s %10s  %s' % ('count', 'total ms', 'max ms', 'statement'))
+        stats = sorted(query_stats.items(), key=lambda item: -item[1]['total'])
+        for fingerprint, stat in stats:
+            print('%6d %10.2f %10.2f  %s' % (
+                stat['count'], stat['total'], stat['max'], fingerprint))
+    if reset:
+        query_stats.clear()
+
+
+def print_plan(connection, sql, params):
+    # Use a separate cursor, the results of the query haven't been fetched.
+    cursor = connection.create_cursor()
+    try:
+        headers, result = explain_query(connection, cursor, sql, params)
+    finally:
+        cursor.close()
+    plan = get_plan_tree(connection.vendor, result)
+    if plan is None:
+        for row in result:
+            print('    ' + ' | '.join('%s' % value for value in row))
+        return
+    print_plan_node(plan)
+
+
+def print_plan_node(node, depth=0):
+    print('    %s%s%s (rows=%s, time=%.2fms)' % (
+        '  ' * depth, node['type'],
+        ' on %s' % node['relation'] if node['relation'] else '',
+        node['actual_rows'], node['time']))
+    for child in node['children']:
+        print_plan_node(child, depth + 1)
 
 
 class PrintQueryWrapper(db_backends_utils.CursorDebugWrapper):
+    # Configured by the options of the command.
+    threshold = 0
+    reformat = True
+    explain = False
+
     def execute(self, sql, params=()):
-        start_time = time()
+        start_time = timer()
+        try:
+            with self.db.wrap_database_errors:
+                return self.cursor.execute(sql, params)
+        finally:
+            duration = (timer() - start_time) * 1000
+            stat = query_stats.setdefault(fingerprint_sql(sql), {
+                'count': 0, 'total': 0, 'max': 0,
+            })
+            stat['count'] += 1
+            stat['total'] += duration
+            stat['max'] = max(stat['max'], duration)
+
+            if duration >= self.threshold:
+                raw_sql = self.db.ops.last_executed_query(self.cursor, sql, params)
+                if self.reformat:
+                    raw_sql = sqlparse.format(raw_sql, reindent=True)
+                print('%s [%.2fms]' % (raw_sql, duration))
+                if self.explain and sql.lstrip().upper().startswith('SELECT'):
+                    print_plan(self.db, sql, params)
+
+
+class Command(shell.Command):
+    # 'debugsqlshell' is the same as the 'shell'.
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--threshold', type=float, default=0, dest='threshold',
+            help='Only print queries that take at least this many milliseconds.',
+        )
+        parser.add_argument(
+            '--no-format', action='store_false', dest='reformat',
+            help="Print queries on one line instead of reindenting them.",
+        )
+        parser.add_argument(
+            '--explain', action='store_true', dest='explain',
+            help='Print the plan of the SELECT queries that are printed.',
+        )
+        parser.add_argument(
+            '--summary', action='store_true', dest='summary',
+            help='Print the count, total and maximum time of each statement on exit.',
+        )
+
+    def handle(self, **options):
+        PrintQueryWrapper.threshold = options['threshold']
+        PrintQueryWrapper.reformat = options['reformat']
+        PrintQueryWrapper.explain = options['explain']
+        # The shells don't take a namespace on every Django version, but they
+        # all see the builtins.
+        builtins.sqlstats = sqlstats
         try:
-            return self.cursor.execute(sql, params)
+            return super(Command, self).handle(**options)
         finally:
-            raw_sql = self.db.ops.last_executed_query(self.cursor, sql, params)
-            end_time = time()
-            duration = (end_time - start_time) * 1000
-            formatted_sql = sqlparse.format(raw_sql, reindent=True)
-            print('%s [%.2fms]' % (formatted_sql, duration))
+            del builtins.sqlstats
+            if options['summary']:
+                sqlstats()
 
 
 db_backends_utils.CursorDebugWrapper = PrintQueryWrapper
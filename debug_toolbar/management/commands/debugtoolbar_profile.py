@@ -0,0 +1,175 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import force_text
+
+from debug_toolbar.panels.sql.utils import fingerprint_sql
+from debug_toolbar.testing import ToolbarClient
+from debug_toolbar.toolbar import DebugToolbar
+
+# Number of functions reported by the profiler, by time spent in themselves.
+HOTSPOTS = 20
+
+
+def get_sql_stats(panel):
+    statements = OrderedDict()
+    for query in panel.get_stats().get('queries', []):
+        key = (query['alias'], fingerprint_sql(query['raw_sql']))
+        statement = statements.setdefault(key, {
+            'alias': query['alias'],
+            'fingerprint': key[1],
+            'count': 0,
+            'time': 0,
+        })
+        statement['count'] += 1
+        statement['time'] += query['duration']
+    return {
+        'count': panel._num_queries,
+        'time': panel._sql_time,
+        'statements': sorted(statements.values(), key=lambda s: -s['time']),
+    }
+
+
+def get_cache_stats(panel):
+    stats = panel.get_stats()
+    return {
+        'count': stats.get('total_calls', 0),
+        'time': stats.get('total_time', 0),
+        'hits': stats.get('hits', 0),
+        'misses': stats.get('misses', 0),
+    }
+
+
+def get_templates_stats(panel):
+    return [
+        force_text(info['template'].name)
+        for info in panel.get_stats().get('templates', [])]
+
+
+def get_timer_stats(panel):
+    stats = panel.get_stats()
+    return dict(
+        (key, stats[key]) for key in ('total_time', 'utime', 'stime') if key in stats)
+
+
+def get_profiling_stats(panel):
+    if not hasattr(panel, 'stats'):
+        return []
+    functions = sorted(panel.stats.stats.items(), key=lambda item: -item[1][2])
+    return [{
+        'function': '%s:%d(%s)' % func,
+        'calls': nc,
+        'own_time': tt * 1000,
+        'cumulative_time': ct * 1000,
+    } for func, (cc, nc, tt, ct, callers) in functions[:HOTSPOTS]]
+
+
+STATS = (
+    ('TimerPanel', 'time', get_timer_stats),
+    ('SQLPanel', 'sql', get_sql_stats),
+    ('CachePanel', 'cache', get_cache_stats),
+    ('TemplatesPanel', 'templates', get_templates_stats),
+    ('ProfilingPanel', 'hotspots', get_profiling_stats),
+)
+
+
+def get_range(runs, key, stat):
+    values = sorted(run[key][stat] for run in runs if stat in run.get(key, {}))
+    if not values:
+        return None
+    return {
+        'min': values[0],
+        'median': values[len(values) // 2],
+        'max': values[-1],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests a URL with the test client, with all the panels of the debug "
+        "toolbar enabled, and writes the stats of each request as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the URL, e.g. /articles/?page=2.')
+        parser.add_argument(
+            '--method', choices=['GET', 'POST'], default='GET',
+            help='HTTP method, GET by default.',
+        )
+        parser.add_argument(
+            '-d', '--data', action='append', default=[], metavar='NAME=VALUE',
+            help='Add a field to the query string or to the POST body. Can be repeated.',
+        )
+        parser.add_argument(
+            '-n', '--repeat', type=int, default=1,
+            help='Number of requests, 1 by default.',
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='Write the stats to this file instead of the standard output.',
+        )
+
+    def handle(self, **options):
+        data = {}
+        for field in options['data']:
+            name, sep, value = field.partition('=')
+            if not sep:
+                raise CommandError("%r isn't in the NAME=VALUE format." % field)
+            data.setdefault(name, []).append(value)
+
+        client = ToolbarClient()
+        for panel_class in DebugToolbar.get_panel_classes():
+            # Intercepting redirects would replace the response.
+            if panel_class.__name__ == 'RedirectsPanel':
+                continue
+            client.cookies[str('djdt' + panel_class.__name__)] = 'on'
+        request = client.post if options['method'] == 'POST' else client.get
+
+        runs = [self.profile(request, options['path'], data) for _ in range(options['repeat'])]
+
+        result = OrderedDict([
+            ('path', options['path']),
+            ('method', options['method']),
+            ('data', data),
+            ('summary', OrderedDict([
+                ('time', get_range(runs, 'time', 'total_time')),
+                ('sql_count', get_range(runs, 'sql', 'count')),
+                ('sql_time', get_range(runs, 'sql', 'time')),
+                ('cache_count', get_range(runs, 'cache', 'count')),
+            ])),
+            ('runs', runs),
+        ])
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def profile(self, request, path, data):
+        response = request(path, data)
+        # Error pages would be profiled instead of the page.
+        if response.status_code >= 400:
+            raise CommandError(
+                "%s returned the status code %d." % (path, response.status_code))
+        toolbar = response.toolbar
+        if toolbar is None:
+            raise CommandError(
+                "The toolbar wasn't enabled for %s. Check that DebugToolbarMiddleware is "
+                "installed and that SHOW_TOOLBAR_CALLBACK accepts the request." % path)
+
+        run = OrderedDict([('status_code', response.status_code)])
+        if toolbar.budget_violations:
+            run['over_budget'] = dict(
+                (violation['metric'], violation['limit'])
+                for violation in toolbar.budget_violations)
+        for panel_id, key, get_stats in STATS:
+            try:
+                panel = toolbar.get_panel_by_id(panel_id)
+            except KeyError:
+                continue
+            if panel.enabled:
+                run[key] = get_stats(panel)
+        return run
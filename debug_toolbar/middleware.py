@@ -63,6 +63,7 @@ class DebugToolbarMiddleware(MiddlewareMixin):
 
         toolbar = DebugToolbar(request)
         self.__class__.debug_toolbars[threading.current_thread().ident] = toolbar
+        request.toolbar = toolbar
 
         # Activate instrumentation ie. monkey-patch.
         for panel in toolbar.enabled_panels:
@@ -125,8 +126,7 @@ class DebugToolbarMiddleware(MiddlewareMixin):
         bits = re.split(pattern, content, flags=re.IGNORECASE)
         if len(bits) > 1:
             # When the toolbar will be inserted for sure, generate the stats.
-            for panel in reversed(toolbar.enabled_panels):
-                panel.generate_stats(request, response)
+            toolbar.generate_stats(response)
 
             bits[-2] += toolbar.render_toolbar()
             response.content = insert_before.join(bits)
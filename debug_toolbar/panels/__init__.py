@@ -131,6 +131,43 @@ class Panel(object):
         should be idempotent.
         """
 
+    def enable_thread_instrumentation(self, parent):
+        """
+        Enable instrumentation in a worker thread started by the view.
+
+        Panels whose instrumentation is per-thread, like database cursors,
+        should install it for the current thread here. ``parent`` is the
+        thread handling the request.
+
+        This method is called in the worker thread by
+        :func:`debug_toolbar.threads.propagate`.
+        """
+
+    def disable_thread_instrumentation(self, parent):
+        """
+        Disable instrumentation in a worker thread started by the view.
+
+        This is the opposite of :meth:`enable_thread_instrumentation`. Panels
+        that collect data per thread should merge it into the data of the
+        ``parent`` thread here.
+        """
+
+    # Contribute events to the request timeline
+
+    def get_timeline_events(self):
+        """
+        Return the events recorded by this panel for the request timeline.
+
+        Each event is a dict with a ``category``, a ``label`` and the
+        ``start_time`` and ``stop_time`` taken with
+        :func:`debug_toolbar.utils.timer`. Instant events, like log records,
+        start and stop at the same time. Set ``io`` to ``True`` for I/O such as
+        SQL queries, the time that isn't spent in I/O is highlighted.
+
+        This method is called after :meth:`generate_stats`.
+        """
+        return []
+
     # Store and retrieve stats (shared between panels for no good reason)
 
     def record_stats(self, stats):
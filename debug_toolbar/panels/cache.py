@@ -1,52 +1,128 @@
 from __future__ import absolute_import, unicode_literals
 
+import functools
 import inspect
+import re
 import sys
-import time
+import threading
 from collections import OrderedDict
+from copy import copy
 
 import django
 from django.conf import settings
 from django.core import cache
 from django.core.cache import CacheHandler, caches as original_caches
 from django.core.cache.backends.base import BaseCache
-from django.dispatch import Signal
 from django.middleware import cache as middleware_cache
+from django.utils.encoding import force_text
+from django.utils.six.moves import cPickle as pickle
 from django.utils.translation import ugettext_lazy as _, ungettext
 
 from debug_toolbar import settings as dt_settings
 from debug_toolbar.panels import Panel
+from debug_toolbar.threads import get_toolbar
 from debug_toolbar.utils import (
-    get_stack, get_template_info, render_stacktrace, tidy_stacktrace,
+    get_call_site, get_stack, get_template_info, render_stacktrace,
+    tidy_stacktrace, timer,
 )
 
 if django.VERSION[:2] < (1, 9):
     from django.core.cache import get_cache as original_get_cache
 
-cache_called = Signal(providing_args=[
-    "time_taken", "name", "return_value", "args", "kwargs", "trace"])
+
+def get_cache_panel():
+    """
+    Return the cache panel of the request handled by the current thread, or
+    ``None`` if the toolbar or the panel isn't active.
+    """
+    toolbar = get_toolbar()
+    if toolbar is None:
+        return None
+    try:
+        panel = toolbar.get_panel_by_id('CachePanel')
+    except KeyError:
+        return None
+    return panel if panel.enabled else None
 
 
-def send_signal(method):
+def record_call(method):
     def wrapped(self, *args, **kwargs):
-        t = time.time()
+        panel = get_cache_panel()
+        if panel is None:
+            return method(self, *args, **kwargs)
+
+        start_time = timer()
         value = method(self, *args, **kwargs)
-        t = time.time() - t
+        stop_time = timer()
 
         if dt_settings.get_config()['ENABLE_STACKTRACES']:
             stacktrace = tidy_stacktrace(reversed(get_stack()))
         else:
             stacktrace = []
 
+        # The call site is recorded even without stack traces, to find loops.
+        call_site = get_call_site()
         template_info = get_template_info()
-        cache_called.send(sender=self.__class__, time_taken=t,
-                          name=method.__name__, return_value=value,
-                          args=args, kwargs=kwargs, trace=stacktrace,
-                          template_info=template_info, backend=self.cache)
+        panel._store_call_info(time_taken=stop_time - start_time,
+                               start_time=start_time, stop_time=stop_time,
+                               name=method.__name__, return_value=value,
+                               args=args, kwargs=kwargs, trace=stacktrace,
+                               call_site=call_site,
+                               template_info=template_info, backend=self.cache)
         return value
     return wrapped
 
 
+def _get_arg(call, index, name):
+    if len(call['args']) > index:
+        return call['args'][index]
+    return call['kwargs'].get(name)
+
+
+def iter_call_keys(call, return_value):
+    """
+    Yield ``(key, value)`` for each key of a cache call that returned
+    ``return_value``. ``value`` is the value read or written, or ``None``.
+    """
+    name = call['name']
+    if name == 'get_many':
+        values = return_value or {}
+        for key in _get_arg(call, 0, 'keys') or []:
+            yield key, values.get(key)
+    elif name == 'set_many':
+        for key, value in (_get_arg(call, 0, 'data') or {}).items():
+            yield key, value
+    elif name == 'delete_many':
+        for key in _get_arg(call, 0, 'keys') or []:
+            yield key, None
+    elif name == 'get':
+        yield _get_arg(call, 0, 'key'), return_value
+    elif name in ('add', 'set'):
+        yield _get_arg(call, 0, 'key'), _get_arg(call, 1, 'value')
+    elif name != 'clear':
+        yield _get_arg(call, 0, 'key'), None
+
+
+def get_value_size(value):
+    """
+    Return the size of ``value`` pickled like cache backends do, or ``None``.
+    """
+    if value is None:
+        return None
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+def get_key_pattern(key):
+    """
+    Replace numbers and hexadecimal ids in ``key``, so that keys built from
+    the same prefix share a pattern, e.g. ``user:*:profile``.
+    """
+    return re.sub(r'[0-9a-f]{8,}|\d+', '*', force_text(key))
+
+
 class CacheStatTracker(BaseCache):
     """A small class used to track cache calls."""
     def __init__(self, cache):
@@ -66,57 +142,57 @@ class CacheStatTracker(BaseCache):
     def __getattr__(self, name):
         return getattr(self.cache, name)
 
-    @send_signal
+    @record_call
     def add(self, *args, **kwargs):
         return self.cache.add(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def get(self, *args, **kwargs):
         return self.cache.get(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def set(self, *args, **kwargs):
         return self.cache.set(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def delete(self, *args, **kwargs):
         return self.cache.delete(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def clear(self, *args, **kwargs):
         return self.cache.clear(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def has_key(self, *args, **kwargs):
         # Ignore flake8 rules for has_key since we need to support caches
         # that may be using has_key.
         return self.cache.has_key(*args, **kwargs)  # noqa
 
-    @send_signal
+    @record_call
     def incr(self, *args, **kwargs):
         return self.cache.incr(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def decr(self, *args, **kwargs):
         return self.cache.decr(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def get_many(self, *args, **kwargs):
         return self.cache.get_many(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def set_many(self, *args, **kwargs):
         self.cache.set_many(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def delete_many(self, *args, **kwargs):
         self.cache.delete_many(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def incr_version(self, *args, **kwargs):
         return self.cache.incr_version(*args, **kwargs)
 
-    @send_signal
+    @record_call
     def decr_version(self, *args, **kwargs):
         return self.cache.decr_version(*args, **kwargs)
 
@@ -132,14 +208,50 @@ class CacheHandlerPatch(CacheHandler):
         return CacheStatTracker(actual_cache)
 
 
-# Must monkey patch the middleware's cache module as well in order to
-# cover per-view level caching. This needs to be monkey patched outside
-# of the enable_instrumentation method since the django's
-# decorator_from_middleware_with_args will store the cache from core.caches
-# when it wraps the view.
-if django.VERSION[:2] < (1, 9):
-    middleware_cache.get_cache = get_cache
-middleware_cache.caches = CacheHandlerPatch()
+def track_middleware_cache(method):
+    """
+    Make a method of Django's cache middleware use a tracked cache.
+
+    ``cache_page`` creates the middleware, and looks its cache up, when the
+    view is decorated. Each call runs on a copy of the middleware, so that
+    the shared instance is never modified. Without an active toolbar, the
+    original method is called directly.
+    """
+    @functools.wraps(method)
+    def wrapped(self, *args):
+        if (get_cache_panel() is not None and
+                not isinstance(self.cache, CacheStatTracker)):
+            middleware = copy(self)
+            middleware.cache = CacheStatTracker(self.cache)
+            self = middleware
+        return method(self, *args)
+    wrapped.original = method
+    return wrapped
+
+
+# The cache middleware methods that use the cache, for site-wide caching and
+# cache_page.
+TRACKED_MIDDLEWARE_METHODS = (
+    (middleware_cache.FetchFromCacheMiddleware, 'process_request'),
+    (middleware_cache.UpdateCacheMiddleware, 'process_response'),
+)
+
+
+def install_middleware_tracking():
+    """
+    Wrap the cache middleware methods, once per process. The classes are
+    shared by all threads, so restoring them at the end of a request would
+    stop the tracking of concurrent requests.
+    """
+    for cls, name in TRACKED_MIDDLEWARE_METHODS:
+        method = cls.__dict__[name]
+        if not hasattr(method, 'original'):
+            setattr(cls, name, track_middleware_cache(method))
+
+
+# Consecutive gets from the same place, at least this many, could be a single
+# get_many.
+GET_MANY_THRESHOLD = 3
 
 
 class CachePanel(Panel):
@@ -169,11 +281,12 @@ class CachePanel(Panel):
             ('incr_version', 0),
             ('decr_version', 0),
         ))
-        cache_called.connect(self._store_call_info)
+        self._thread = threading.current_thread()
 
-    def _store_call_info(self, sender, name=None, time_taken=0,
+    def _store_call_info(self, name=None, time_taken=0,
                          return_value=None, args=None, kwargs=None,
-                         trace=None, template_info=None, backend=None, **kw):
+                         trace=None, call_site=None, template_info=None,
+                         backend=None, start_time=None, stop_time=None):
         if name == 'get':
             if return_value is None:
                 self.misses += 1
@@ -189,15 +302,29 @@ class CachePanel(Panel):
 
         self.total_time += time_taken
         self.counts[name] += 1
-        self.calls.append({
+        call = {
             'time': time_taken,
             'name': name,
             'args': args,
             'kwargs': kwargs,
             'trace': render_stacktrace(trace),
+            'call_site': call_site,
             'template_info': template_info,
-            'backend': backend
-        })
+            'backend': backend,
+            'start_time': start_time,
+            'stop_time': stop_time,
+        }
+        # Values aren't kept: they may be large, and the caller may modify
+        # them before the stats are generated.
+        call['keys'] = [{
+            'key': key,
+            'hit': value is not None if name in ('get', 'get_many') else None,
+            'size': get_value_size(value),
+        } for key, value in iter_call_keys(call, return_value)]
+        thread = threading.current_thread()
+        if thread is not self._thread:
+            call['thread'] = thread.name
+        self.calls.append(call)
 
     # Implement the Panel API
 
@@ -221,26 +348,157 @@ class CachePanel(Panel):
     def enable_instrumentation(self):
         if django.VERSION[:2] < (1, 9):
             cache.get_cache = get_cache
-        if isinstance(middleware_cache.caches, CacheHandlerPatch):
-            cache.caches = middleware_cache.caches
-        else:
+        if not isinstance(cache.caches, CacheHandlerPatch):
             cache.caches = CacheHandlerPatch()
+        install_middleware_tracking()
 
     def disable_instrumentation(self):
         if django.VERSION[:2] < (1, 9):
             cache.get_cache = original_get_cache
         cache.caches = original_caches
-        # While it can be restored to the original, any views that were
-        # wrapped with the cache_page decorator will continue to use a
-        # monkey patched cache.
-        middleware_cache.caches = original_caches
+
+    def get_timeline_events(self):
+        return [{
+            'category': _("Cache"),
+            'label': '%s(%r)' % (call['name'], call['args'][0]) if call['args'] else call['name'],
+            'start_time': call['start_time'],
+            'stop_time': call['stop_time'],
+            'io': True,
+        } for call in self.calls if call['start_time'] is not None]
+
+    def get_key_stats(self):
+        """
+        Aggregate the calls by key, by key pattern and by backend.
+        """
+        threshold = self.toolbar.config['CACHE_SIZE_WARNING_THRESHOLD']
+        keys = OrderedDict()
+        backends = OrderedDict()
+        for call in self.calls:
+            backend = backends.setdefault(force_text(call['backend']), {'calls': 0, 'time': 0})
+            backend['calls'] += 1
+            backend['time'] += call['time']
+
+            for call_key in call['keys']:
+                key = call_key['key']
+                stats = keys.get(key)
+                if stats is None:
+                    stats = keys[key] = {
+                        'key': key, 'pattern': get_key_pattern(key), 'calls': 0,
+                        'reads': 0, 'hits': 0, 'misses': 0, 'size': None, 'time': 0,
+                        'is_set': False, 'read_after_set': False,
+                    }
+                stats['calls'] += 1
+                stats['time'] += call['time'] / len(call['keys'])
+                if call['name'] in ('get', 'get_many', 'has_key'):
+                    stats['reads'] += 1
+                    stats['read_after_set'] = stats['read_after_set'] or stats['is_set']
+                if call_key['hit'] is not None:
+                    stats['hits' if call_key['hit'] else 'misses'] += 1
+                elif call['name'] in ('add', 'set', 'set_many'):
+                    stats['is_set'] = True
+                if call_key['size'] is not None:
+                    stats['size'] = max(stats['size'] or 0, call_key['size'])
+
+        patterns = OrderedDict()
+        for stats in keys.values():
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = 100.0 * stats['hits'] / lookups if lookups else None
+            stats['memoize'] = stats['reads'] > 1 or stats['read_after_set']
+            stats['is_large'] = stats['size'] is not None and stats['size'] >= threshold
+
+            pattern = patterns.setdefault(stats['pattern'], {
+                'pattern': stats['pattern'], 'keys': 0, 'calls': 0,
+                'hits': 0, 'misses': 0, 'size': 0, 'time': 0,
+            })
+            pattern['keys'] += 1
+            for name in ('calls', 'hits', 'misses', 'time'):
+                pattern[name] += stats[name]
+            pattern['size'] += stats['size'] or 0
+        for pattern in patterns.values():
+            lookups = pattern['hits'] + pattern['misses']
+            pattern['hit_ratio'] = 100.0 * pattern['hits'] / lookups if lookups else None
+
+        return {
+            'keys': sorted(keys.values(), key=lambda stats: -stats['calls']),
+            'key_patterns': sorted(patterns.values(), key=lambda pattern: -pattern['calls']),
+            'backends': backends,
+        }
+
+    def get_findings(self):
+        """
+        Find keys that miss several times, values that are computed between a
+        missed get and a set of the same key, and loops of gets.
+        """
+        findings = []
+        misses = OrderedDict()
+        pending = {}
+        for call in self.calls:
+            if call['name'] == 'get':
+                key = _get_arg(call, 0, 'key')
+                if not call['keys'][0]['hit']:
+                    misses.setdefault(key, []).append(call)
+                    pending[key] = call
+                else:
+                    pending.pop(key, None)
+            elif call['name'] in ('add', 'set'):
+                key = _get_arg(call, 0, 'key')
+                miss = pending.pop(key, None)
+                if miss is not None and call['start_time'] is not None:
+                    findings.append({
+                        'type': 'recompute',
+                        'keys': [key],
+                        'count': 1,
+                        'time': (call['start_time'] - miss['stop_time']) * 1000,
+                        'traces': [miss['trace'], call['trace']],
+                    })
+
+        for key, calls in misses.items():
+            if len(calls) > 1:
+                findings.append({
+                    'type': 'repeated_miss',
+                    'keys': [key],
+                    'count': len(calls),
+                    'time': sum(call['time'] for call in calls),
+                    'traces': [calls[0]['trace']],
+                })
+
+        run = []
+        for call in self.calls + [None]:
+            if (call is not None and call['name'] == 'get' and run and
+                    self._same_call_site(run[-1], call)):
+                run.append(call)
+                continue
+            if len(run) >= GET_MANY_THRESHOLD:
+                findings.append({
+                    'type': 'get_loop',
+                    'keys': [_get_arg(get, 0, 'key') for get in run],
+                    'count': len(run),
+                    'time': sum(get['time'] for get in run),
+                    'traces': [run[0]['trace']],
+                })
+            run = [call] if call is not None and call['name'] == 'get' else []
+
+        findings.sort(key=lambda finding: -finding['time'])
+        return findings
+
+    @staticmethod
+    def _same_call_site(first, second):
+        # Without a call site, gets can't be told apart from separate lines.
+        if first.get('call_site') is None:
+            return False
+        return all(first.get(name) == second.get(name)
+                   for name in ('call_site', 'template_info', 'backend',
+                                'thread'))
 
     def generate_stats(self, request, response):
-        self.record_stats({
+        stats = {
             'total_calls': len(self.calls),
             'calls': self.calls,
             'total_time': self.total_time,
             'hits': self.hits,
             'misses': self.misses,
             'counts': self.counts,
-        })
+        }
+        stats.update(self.get_key_stats())
+        stats['findings'] = self.get_findings()
+        self.record_stats(stats)
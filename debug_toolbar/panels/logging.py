@@ -6,7 +6,7 @@ import logging
 from django.utils.translation import ugettext_lazy as _, ungettext
 
 from debug_toolbar.panels import Panel
-from debug_toolbar.utils import ThreadCollector
+from debug_toolbar.utils import ThreadCollector, timer
 
 try:
     import threading
@@ -44,6 +44,7 @@ class ThreadTrackingHandler(logging.Handler):
             'file': record.pathname,
             'line': record.lineno,
             'channel': record.name,
+            'timestamp': timer(),
         }
         self.collector.collect(record)
 
@@ -74,9 +75,25 @@ class LoggingPanel(Panel):
 
     title = _("Log messages")
 
+    def enable_thread_instrumentation(self, parent):
+        collector.clear_collection()
+
+    def disable_thread_instrumentation(self, parent):
+        name = threading.current_thread().name
+        for record in collector.merge_collection(parent):
+            record['thread'] = name
+
     def process_request(self, request):
         collector.clear_collection()
 
+    def get_timeline_events(self):
+        return [{
+            'category': _("Log"),
+            'label': '%s: %s' % (record['level'], record['message']),
+            'start_time': record['timestamp'],
+            'stop_time': record['timestamp'],
+        } for record in self.get_stats().get('records', [])]
+
     def generate_stats(self, request, response):
         records = collector.get_collection()
         self._records[threading.currentThread()] = records
@@ -1,22 +1,44 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import cProfile
+import json
 import os
+import sys
+import threading
+import zlib
+from collections import Counter, OrderedDict
 from colorsys import hsv_to_rgb
 from pstats import Stats
 
+from django.conf.urls import url
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
 from django.utils import six
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
 from debug_toolbar import settings as dt_settings
 from debug_toolbar.panels import Panel
+from debug_toolbar.toolbar import DebugToolbar
+from debug_toolbar.utils import is_toolbar_file, timer
 
 # Occasionally the disable method on the profiler is listed before
 # the actual view functions. This function call should be ignored as
 # it leads to an error within the tests.
 INVALID_PROFILER_FUNC = '_lsprof.Profiler'
 
+# Caller of the functions of a profile that doesn't start with a single call.
+REQUEST_FUNC = ('~', 0, '<request>')
+
+# Stacks reconstructed from cProfile statistics stop at this depth, and at
+# functions that take less than this share of the time of the view.
+MAX_STACK_DEPTH = 100
+MIN_STACK_SHARE = 0.001
+
+# Frames narrower than this share of the flame graph aren't drawn.
+FLAME_GRAPH_MIN_WIDTH = 0.001
+FLAME_GRAPH_ROW_HEIGHT = 18  # px
+
 
 def contains_profiler(func_tuple):
     """Helper function that checks to see if the tuple contains
@@ -28,6 +50,33 @@ def contains_profiler(func_tuple):
     return has_profiler
 
 
+def func_std_string(func_name):
+    if func_name[:2] == ('~', 0):
+        # special case for built-in functions
+        name = func_name[2]
+        if name.startswith('<') and name.endswith('>'):
+            return '{%s}' % name[1:-1]
+        else:
+            return name
+    else:
+        file_name, line_num, method = func_name
+        idx = file_name.find('/site-packages/')
+        if idx > -1:
+            file_name = file_name[(idx + 14):]
+
+        file_path, _, file_name = file_name.rpartition(os.sep)
+
+        return mark_safe(
+            '<span class="djdt-path">{0}/</span>'
+            '<span class="djdt-file">{1}</span>'
+            ' in <span class="djdt-func">{3}</span>'
+            '(<span class="djdt-lineno">{2}</span>)'.format(
+                file_path,
+                file_name,
+                line_num,
+                method))
+
+
 class DjangoDebugToolbarStats(Stats):
     __root = None
 
@@ -39,6 +88,51 @@ class DjangoDebugToolbarStats(Stats):
                     break
         return self.__root
 
+    def add_root_func(self, func):
+        """
+        Make ``func`` the caller of the functions that don't have one, and the
+        root of the profile.
+        """
+        cum_time = 0
+        for other, (cc, nc, tt, ct, callers) in self.stats.items():
+            if not callers and not contains_profiler(other):
+                callers[func] = (cc, nc, tt, ct)
+                cum_time += ct
+        self.stats[func] = (1, 1, 0, cum_time, {})
+        self.__root = func
+
+    def exclude_funcs(self, exclude):
+        """
+        Remove the functions for which ``exclude(func)`` is true. Their callees
+        are attributed to their callers, in proportion to the time spent in
+        them from each caller. Must be called before ``calc_callees``.
+        """
+        callees = {}
+        for func, (cc, nc, tt, ct, callers) in self.stats.items():
+            for caller in callers:
+                callees.setdefault(caller, set()).add(func)
+
+        for func in [func for func in self.stats if exclude(func)]:
+            cc, nc, tt, ct, callers = self.stats.pop(func)
+            callers.pop(func, None)
+            for caller in callers:
+                callees[caller].discard(func)
+            for callee in callees.pop(func, ()):
+                if callee == func:
+                    continue
+                callee_callers = self.stats[callee][4]
+                edge = callee_callers.pop(func)
+                for caller, caller_edge in callers.items():
+                    share = caller_edge[3] / ct if ct else caller_edge[1] / nc
+                    merged = callee_callers.get(caller, (0, 0, 0, 0))
+                    callee_callers[caller] = (
+                        merged[0] + int(round(edge[0] * share)),
+                        merged[1] + int(round(edge[1] * share)),
+                        merged[2] + edge[2] * share,
+                        merged[3] + edge[3] * share,
+                    )
+                    callees[caller].add(callee)
+
 
 class FunctionCall(object):
     def __init__(self, statobj, func, depth=0, stats=None,
@@ -62,31 +156,7 @@ class FunctionCall(object):
         return 'rgb(%f%%,%f%%,%f%%)' % (r * 100, g * 100, b * 100)
 
     def func_std_string(self):  # match what old profile produced
-        func_name = self.func
-        if func_name[:2] == ('~', 0):
-            # special case for built-in functions
-            name = func_name[2]
-            if name.startswith('<') and name.endswith('>'):
-                return '{%s}' % name[1:-1]
-            else:
-                return name
-        else:
-            file_name, line_num, method = self.func
-            idx = file_name.find('/site-packages/')
-            if idx > -1:
-                file_name = file_name[(idx + 14):]
-
-            file_path, file_name = file_name.rsplit(os.sep, 1)
-
-            return mark_safe(
-                '<span class="djdt-path">{0}/</span>'
-                '<span class="djdt-file">{1}</span>'
-                ' in <span class="djdt-func">{3}</span>'
-                '(<span class="djdt-lineno">{2}</span>)'.format(
-                    file_path,
-                    file_name,
-                    line_num,
-                    method))
+        return func_std_string(self.func)
 
     def subfuncs(self):
         i = 0
@@ -137,6 +207,257 @@ class FunctionCall(object):
         return 16 * self.depth
 
 
+class Sampler(object):
+    """
+    Statistical profiler: a background thread records the stack of the
+    profiled thread every ``interval`` seconds.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def start(self, base_frame):
+        """
+        Start sampling the current thread. Only the frames called from
+        ``base_frame`` are recorded.
+        """
+        self._base_frame = base_frame
+        self._ident = threading.current_thread().ident
+        self._thread = threading.Thread(target=self._run, name='djdt-sampler')
+        self._thread.daemon = True
+        self.start_time = timer()
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._stopped.set()
+        self._thread.join()
+        self.stop_time = timer()
+
+    def runcall(self, func, *args, **kwargs):
+        self.start(sys._getframe())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._ident)
+            stack = []
+            while frame is not None and frame is not self._base_frame:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            # Discard samples taken after func returned.
+            if frame is not None and stack and self._running:
+                self.samples[tuple(reversed(stack))] += 1
+
+
+class SampleNode(object):
+    """
+    Node of the call tree built from the samples of a :class:`Sampler`.
+    """
+    def __init__(self, func=None, depth=0, id='0', parent_ids=None):
+        self.func = func
+        self.depth = depth
+        self.id = id
+        self.parent_ids = parent_ids or []
+        self.children = OrderedDict()
+        self.samples = 0
+        self.self_samples = 0
+
+    @classmethod
+    def build(cls, samples):
+        root = cls()
+        for stack, count in samples.items():
+            node = root
+            node.samples += count
+            for code in stack:
+                func = (code.co_filename, code.co_firstlineno, code.co_name)
+                if func not in node.children:
+                    node.children[func] = cls(
+                        func, node.depth + 1, '%s_%d' % (node.id, len(node.children)),
+                        node.parent_ids + [node.id])
+                node = node.children[func]
+                node.samples += count
+            node.self_samples += count
+        return root
+
+    def func_std_string(self):
+        return func_std_string(self.func)
+
+    def indent(self):
+        return 16 * (self.depth - 1)
+
+
+def func_label(func):
+    """
+    Return a plain text label for ``func``, a ``(file, line, name)`` tuple.
+    """
+    if func[:2] == ('~', 0):
+        return func[2]
+    file_name, line_num, method = func
+    return '%s (%s:%d)' % (method, os.path.basename(file_name), line_num)
+
+
+def get_profile_stacks(stats, root):
+    """
+    Return the call stacks below ``root`` in ``stats``, a
+    :class:`DjangoDebugToolbarStats` with callees, as ``(stack, own time)``
+    pairs, in seconds.
+
+    cProfile only records callers and callees, so the time of a function is
+    split between its stacks in proportion to the time spent in it from each
+    caller. Recursive calls are skipped.
+    """
+    min_time = stats.stats[root][3] * MIN_STACK_SHARE
+    stacks = []
+    pending = [((root,), stats.stats[root][2], stats.stats[root][3])]
+    while pending:
+        stack, own_time, cum_time = pending.pop()
+        func = stack[-1]
+        total_time = stats.stats[func][3]
+        share = cum_time / total_time if total_time else 0
+        for callee, (cc, nc, tt, ct) in stats.all_callees[func].items():
+            if callee in stack or contains_profiler(callee):
+                continue
+            # Functions below the thresholds are counted in their caller.
+            if len(stack) >= MAX_STACK_DEPTH or ct * share < min_time:
+                own_time += ct * share
+            else:
+                pending.append((stack + (callee,), tt * share, ct * share))
+        stacks.append((stack, own_time))
+    return stacks
+
+
+def get_sample_stacks(samples):
+    """
+    Return the stacks recorded by a :class:`Sampler` as ``(stack, number of
+    samples)`` pairs.
+    """
+    return [
+        (tuple((code.co_filename, code.co_firstlineno, code.co_name) for code in stack), count)
+        for stack, count in samples.items()]
+
+
+def get_flame_graph(stacks, ms_per_unit):
+    """
+    Return the frames of a flame graph of ``stacks``, ``(stack, value)``
+    pairs. Frames are dicts with their ``depth``, their ``top`` offset in px,
+    their ``left`` offset and ``width`` in percent of the total value, and
+    their ``time`` in ms.
+    """
+    root = [0, OrderedDict()]
+    for stack, value in stacks:
+        node = root
+        node[0] += value
+        for func in stack:
+            node = node[1].setdefault(func, [0, OrderedDict()])
+            node[0] += value
+    if not root[0]:
+        return []
+
+    frames = []
+    pending = [(root, 0, 0)]
+    while pending:
+        (value, children), depth, left = pending.pop()
+        for func, child in children.items():
+            width = child[0] / root[0]
+            if width >= FLAME_GRAPH_MIN_WIDTH:
+                # Functions of the same file get the same color.
+                hue = (zlib.crc32(func[0].encode('utf-8')) & 0xffff) / 0xffff
+                r, g, b = hsv_to_rgb(hue * 0.12, 0.6, 1)
+                frames.append({
+                    'depth': depth,
+                    'top': depth * FLAME_GRAPH_ROW_HEIGHT,
+                    'left': left * 100,
+                    'width': width * 100,
+                    'label': func_label(func),
+                    'func': func,
+                    'time': child[0] * ms_per_unit,
+                    'background': 'rgb(%d,%d,%d)' % (r * 255, g * 255, b * 255),
+                })
+                pending.append((child, depth + 1, left))
+            left += width
+    frames.sort(key=lambda frame: (frame['depth'], frame['left']))
+    return frames
+
+
+def format_folded(stacks, unit):
+    """
+    Return ``stacks`` in the collapsed stack format of FlameGraph: one line
+    per stack, with the frames separated by semicolons and the value.
+    """
+    lines = []
+    for stack, value in stacks:
+        if unit == 'seconds':
+            value = int(round(value * 1000000))
+        if value > 0:
+            lines.append('%s %d' % (
+                ';'.join(func_label(func).replace(';', ',') for func in stack), value))
+    return '\n'.join(lines) + '\n'
+
+
+def format_speedscope(stacks, unit, name):
+    """
+    Return ``stacks`` as a sampled profile in the file format of speedscope.
+    """
+    frames = OrderedDict()
+    samples = []
+    weights = []
+    for stack, value in stacks:
+        if unit == 'seconds':
+            value = int(round(value * 1000000))
+        if value <= 0:
+            continue
+        samples.append([frames.setdefault(func, len(frames)) for func in stack])
+        weights.append(value)
+    return OrderedDict([
+        ('$schema', 'https://www.speedscope.app/file-format-schema.json'),
+        ('shared', {'frames': [
+            {'name': func[2]} if func[:2] == ('~', 0) else
+            {'name': func[2], 'file': func[0], 'line': func[1]}
+            for func in frames]}),
+        ('profiles', [OrderedDict([
+            ('type', 'sampled'),
+            ('name', name),
+            ('unit', 'microseconds' if unit == 'seconds' else 'none'),
+            ('startValue', 0),
+            ('endValue', sum(weights)),
+            ('samples', samples),
+            ('weights', weights),
+        ])]),
+        ('name', name),
+        ('exporter', 'django-debug-toolbar'),
+    ])
+
+
+def profiling_export(request):
+    """Returns the profile of a request in a format of external tools"""
+    toolbar = DebugToolbar.fetch(request.GET.get('store_id', ''))
+    if toolbar is None:
+        return HttpResponseBadRequest('Data unavailable')
+    stats = toolbar.get_panel_by_id('ProfilingPanel').get_stats()
+    if 'stacks' not in stats:
+        return HttpResponseBadRequest('Data unavailable')
+
+    name = '%s %s' % (toolbar.request.method, toolbar.request.path)
+    if request.GET.get('format') == 'speedscope':
+        content = json.dumps(format_speedscope(stats['stacks'], stats['stack_unit'], name))
+        response = HttpResponse(content, content_type='application/json')
+        file_name = 'profile-%s.speedscope.json' % toolbar.store_id
+    elif request.GET.get('format') == 'folded':
+        content = format_folded(stats['stacks'], stats['stack_unit'])
+        response = HttpResponse(content, content_type='text/plain; charset=utf-8')
+        file_name = 'profile-%s.folded' % toolbar.store_id
+    else:
+        return HttpResponseBadRequest('Unknown format')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % file_name
+    return response
+
+
 class ProfilingPanel(Panel):
     """
     Panel that displays profiling information.
@@ -145,11 +466,56 @@ class ProfilingPanel(Panel):
 
     template = 'debug_toolbar/panels/profiling.html'
 
+    @property
+    def content(self):
+        # The flame graph is only laid out when the panel is displayed.
+        stats = self.get_stats()
+        flame_graph = get_flame_graph(
+            stats.get('stacks', []), stats.get('ms_per_sample', 1000))
+        height = max(frame['top'] for frame in flame_graph) if flame_graph else 0
+        return render_to_string(self.template, dict(
+            stats, flame_graph=flame_graph,
+            flame_graph_height=height + FLAME_GRAPH_ROW_HEIGHT,
+            store_id=self.toolbar.store_id))
+
+    @classmethod
+    def get_urls(cls):
+        return [
+            url(r'^profiling_export/$', profiling_export, name='profiling_export'),
+        ]
+
+    def process_request(self, request):
+        if not self.toolbar.config['PROFILER_WHOLE_REQUEST']:
+            return
+        if self.toolbar.config['PROFILER_SAMPLING']:
+            # Record the frames called from the caller of the middleware.
+            frame = sys._getframe()
+            while is_toolbar_file(frame.f_code.co_filename):
+                frame = frame.f_back
+            self.sampler = Sampler(self.toolbar.config['PROFILER_SAMPLE_INTERVAL'] / 1000)
+            self.sampler.start(frame)
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
     def process_view(self, request, view_func, view_args, view_kwargs):
-        self.profiler = cProfile.Profile()
+        if self.toolbar.config['PROFILER_WHOLE_REQUEST']:
+            return
         args = (request,) + view_args
+        if self.toolbar.config['PROFILER_SAMPLING']:
+            self.sampler = Sampler(self.toolbar.config['PROFILER_SAMPLE_INTERVAL'] / 1000)
+            return self.sampler.runcall(view_func, *args, **view_kwargs)
+        self.profiler = cProfile.Profile()
         return self.profiler.runcall(view_func, *args, **view_kwargs)
 
+    def process_response(self, request, response):
+        if not self.toolbar.config['PROFILER_WHOLE_REQUEST']:
+            return
+        if hasattr(self, 'sampler'):
+            self.sampler.stop()
+        elif hasattr(self, 'profiler'):
+            self.profiler.disable()
+
     def add_node(self, func_list, func, max_depth, cum_time=0.1):
         func_list.append(func)
         func.has_subfuncs = False
@@ -159,12 +525,59 @@ class ProfilingPanel(Panel):
                     func.has_subfuncs = True
                     self.add_node(func_list, subfunc, max_depth, cum_time=cum_time)
 
+    def add_sample_nodes(self, func_list, node, max_depth, min_samples, ms_per_sample):
+        for child in node.children.values():
+            if child.samples < min_samples:
+                continue
+            child.time = child.samples * ms_per_sample
+            child.self_time = child.self_samples * ms_per_sample
+            child.has_subfuncs = child.depth < max_depth and any(
+                grandchild.samples >= min_samples for grandchild in child.children.values())
+            func_list.append(child)
+            if child.has_subfuncs:
+                self.add_sample_nodes(func_list, child, max_depth, min_samples, ms_per_sample)
+
+    def generate_sampling_stats(self):
+        sampler = self.sampler
+        samples = sampler.samples
+        sample_count = sum(samples.values())
+        if self.toolbar.config['PROFILER_WHOLE_REQUEST']:
+            samples = Counter()
+            for stack, count in sampler.samples.items():
+                stack = tuple(
+                    code for code in stack if not is_toolbar_file(code.co_filename))
+                if stack:
+                    samples[stack] += count
+        root = SampleNode.build(samples)
+        # The sampling interval is only a target, the time per sample is
+        # measured instead.
+        total_time = (sampler.stop_time - sampler.start_time) * 1000
+        ms_per_sample = total_time / sample_count if sample_count else 0
+        func_list = []
+        self.add_sample_nodes(
+            func_list, root, dt_settings.get_config()['PROFILER_MAX_DEPTH'],
+            max(root.samples / 100, 1), ms_per_sample)
+        self.record_stats({
+            'func_list': func_list,
+            'sampling': True,
+            'sample_count': root.samples,
+            'ms_per_sample': ms_per_sample,
+            'total_time': total_time,
+            'stacks': get_sample_stacks(samples),
+            'stack_unit': 'samples',
+        })
+
     def generate_stats(self, request, response):
+        if hasattr(self, 'sampler'):
+            return self.generate_sampling_stats()
         if not hasattr(self, 'profiler'):
             return None
         # Could be delayed until the panel content is requested (perf. optim.)
         self.profiler.create_stats()
         self.stats = DjangoDebugToolbarStats(self.profiler)
+        if self.toolbar.config['PROFILER_WHOLE_REQUEST']:
+            self.stats.add_root_func(REQUEST_FUNC)
+            self.stats.exclude_funcs(lambda func: is_toolbar_file(func[0]))
         self.stats.calc_callees()
 
         root = FunctionCall(self.stats, self.stats.get_root_func(), depth=0)
@@ -175,4 +588,8 @@ class ProfilingPanel(Panel):
                       dt_settings.get_config()['PROFILER_MAX_DEPTH'],
                       root.stats[3] / 8)
 
-        self.record_stats({'func_list': func_list})
+        self.record_stats({
+            'func_list': func_list,
+            'stacks': get_profile_stacks(self.stats, root.func),
+            'stack_unit': 'seconds',
+        })
@@ -14,6 +14,47 @@ from django.db.models.signals import (
 from django.utils.translation import ugettext_lazy as _, ungettext
 
 from debug_toolbar.panels import Panel
+from debug_toolbar.threads import get_toolbar
+from debug_toolbar.utils import timer
+
+
+def get_signals_panel():
+    """
+    Return the signals panel of the request handled by the current thread, or
+    ``None`` if the toolbar or the panel isn't active.
+    """
+    toolbar = get_toolbar()
+    if toolbar is None:
+        return None
+    try:
+        panel = toolbar.get_panel_by_id('SignalsPanel')
+    except KeyError:
+        return None
+    return panel if panel.enabled else None
+
+
+def _timed_send(name, signal):
+    send = signal.send
+
+    def send_and_record(sender, **named):
+        if not signal.receivers:
+            return send(sender, **named)
+        panel = get_signals_panel()
+        if panel is None:
+            return send(sender, **named)
+        start_time = timer()
+        try:
+            return send(sender, **named)
+        finally:
+            panel.sends.append({
+                'name': name,
+                'sender': sender,
+                'start_time': start_time,
+                'stop_time': timer(),
+            })
+
+    send_and_record.original = send
+    return send_and_record
 
 
 class SignalsPanel(Panel):
@@ -34,6 +75,14 @@ class SignalsPanel(Panel):
         'post_migrate': post_migrate,
     }
 
+    # These signals are sent for every model instance or class. Timing them
+    # would flood the timeline.
+    UNTIMED_SIGNALS = ('class_prepared', 'pre_init', 'post_init')
+
+    def __init__(self, *args, **kwargs):
+        super(SignalsPanel, self).__init__(*args, **kwargs)
+        self.sends = []
+
     def nav_subtitle(self):
         signals = self.get_stats()['signals']
         num_receivers = sum(len(s[2]) for s in signals)
@@ -60,6 +109,25 @@ class SignalsPanel(Panel):
             signals[signal_name] = getattr(signals_mod, signal_name)
         return signals
 
+    def enable_instrumentation(self):
+        # Signals are shared by all threads, so they're wrapped the first time
+        # and never restored, which would stop the timing of concurrent
+        # requests. Without an active toolbar, the wrapper only forwards.
+        for name, signal in self.signals.items():
+            if signal is None or name in self.UNTIMED_SIGNALS:
+                continue
+            if not hasattr(signal.send, 'original'):
+                signal.send = _timed_send(name, signal)
+
+    def get_timeline_events(self):
+        return [{
+            'category': _("Signal"),
+            'label': '%s (%s)' % (
+                send['name'], getattr(send['sender'], '__name__', send['sender'])),
+            'start_time': send['start_time'],
+            'stop_time': send['stop_time'],
+        } for send in self.sends]
+
     def generate_stats(self, request, response):
         signals = []
         for name, signal in sorted(self.signals.items(), key=lambda x: x[0]):
@@ -5,15 +5,94 @@ import json
 
 from django import forms
 from django.conf import settings
+from django.core import signing
 from django.core.exceptions import ValidationError
 from django.db import connections
 from django.utils.encoding import force_text
 from django.utils.functional import cached_property
 
 from debug_toolbar.panels.sql.utils import reformat_sql
+from debug_toolbar.toolbar import DebugToolbar
 
+# Signs the store ids of toolbars sent to the SQL views.
+signer = signing.Signer(salt='debug_toolbar.panels.sql')
 
-class SQLSelectForm(forms.Form):
+
+class BaseSQLForm(forms.Form):
+    """
+    Common interface of the forms that provide a query to the SQL views.
+    """
+    page = forms.IntegerField(required=False, min_value=1)
+
+    def __init__(self, *args, **kwargs):
+        super(BaseSQLForm, self).__init__(*args, **kwargs)
+
+        for name in self.fields:
+            self.fields[name].widget = forms.HiddenInput()
+
+    def reformat_sql(self):
+        return reformat_sql(self.cleaned_data['sql'])
+
+    @property
+    def connection(self):
+        return connections[self.cleaned_data['alias']]
+
+    @cached_property
+    def cursor(self):
+        return self.connection.cursor()
+
+
+class SQLQueryForm(BaseSQLForm):
+    """
+    Look up a query recorded by the SQL panel of a stored toolbar
+
+        store_id: the signed store id of the toolbar
+        query: the index of the query in the SQL panel
+        page: the page of results to display, for sql_select
+    """
+    store_id = forms.CharField()
+    query = forms.IntegerField(min_value=0)
+
+    def clean_store_id(self):
+        try:
+            return signer.unsign(self.cleaned_data['store_id'])
+        except signing.BadSignature:
+            raise ValidationError('Tamper alert')
+
+    def clean(self):
+        cleaned_data = super(SQLQueryForm, self).clean()
+        if self.errors:
+            return cleaned_data
+
+        toolbar = DebugToolbar.fetch(cleaned_data['store_id'])
+        if toolbar is None:
+            raise ValidationError("Data for this panel isn't available anymore")
+        queries = toolbar.get_panel_by_id('SQLPanel').get_stats().get('queries', [])
+        try:
+            query = queries[cleaned_data['query']]
+        except IndexError:
+            raise ValidationError('Query not found')
+
+        if not query['is_select']:
+            raise ValidationError("Only 'select' queries are allowed.")
+        if query['alias'] not in connections:
+            raise ValidationError("Database alias '%s' not found" % query['alias'])
+        try:
+            params = json.loads(query['params'])
+        except ValueError:
+            raise ValidationError('Is not valid JSON')
+
+        cleaned_data.update({
+            'sql': query['sql'],
+            'raw_sql': query['raw_sql'],
+            'params': params,
+            'alias': query['alias'],
+            'duration': query['duration'],
+        })
+        return cleaned_data
+
+
+class SQLSelectForm(BaseSQLForm):
     """
     Validate params
 
@@ -22,6 +101,9 @@ class SQLSelectForm(forms.Form):
         params: JSON encoded parameter values
         duration: time for SQL to execute passed in from toolbar just for redisplay
         hash: the hash of (secret + sql + params) for tamper checking
+        page: the page of results to display, for sql_select
+
+    Only used when the toolbar isn't stored, see :class:`SQLQueryForm`.
     """
     sql = forms.CharField()
     raw_sql = forms.CharField()
@@ -38,9 +120,6 @@ class SQLSelectForm(forms.Form):
 
         super(SQLSelectForm, self).__init__(*args, **kwargs)
 
-        for name in self.fields:
-            self.fields[name].widget = forms.HiddenInput()
-
     def clean_raw_sql(self):
         value = self.cleaned_data['raw_sql']
 
@@ -73,9 +152,6 @@ class SQLSelectForm(forms.Form):
 
         return hash
 
-    def reformat_sql(self):
-        return reformat_sql(self.cleaned_data['sql'])
-
     def make_hash(self, data):
         items = [settings.SECRET_KEY, data['sql'], data['params']]
         # Replace lines endings with spaces to preserve the hash value
@@ -83,10 +159,11 @@ class SQLSelectForm(forms.Form):
         items = [' '.join(force_text(item).splitlines()) for item in items]
         return hashlib.sha1(''.join(items).encode('utf-8')).hexdigest()
 
-    @property
-    def connection(self):
-        return connections[self.cleaned_data['alias']]
 
-    @cached_property
-    def cursor(self):
-        return self.connection.cursor()
+def get_sql_form(data):
+    """
+    Return the form matching the data posted to a SQL view.
+    """
+    if data is not None and 'query' in data:
+        return SQLQueryForm(data)
+    return SQLSelectForm(data)
@@ -0,0 +1,122 @@
+"""
+Find columns that queries filter, join or sort on without an index.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import ugettext_lazy as _
+
+# Split statements on the keywords that start a clause. Column references
+# that follow WHERE, ON and ORDER BY are filters, joins and sorts.
+_CLAUSE_RE = re.compile(
+    r'\b(WHERE|ON|ORDER BY|SELECT|FROM|(?:(?:INNER|LEFT|RIGHT|FULL|CROSS)'
+    r'(?: OUTER)? )?JOIN|GROUP BY|HAVING|LIMIT|OFFSET|UNION|SET)\b', re.IGNORECASE)
+_ROLES = {
+    'WHERE': _("filter"),
+    'ON': _("join"),
+    'ORDER BY': _("sort"),
+}
+# Django qualifies columns with the table name or with an alias like T3.
+_COLUMN_RE = re.compile(r'["`](\w+)["`]\.["`](\w+)["`]')
+_TABLE_RE = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE)\s+["`](\w+)["`](?:\s+(?:AS\s+)?["`]?([A-Z]+\d+)\b)?',
+    re.IGNORECASE)
+
+
+@lru_cache(maxsize=1000)
+def get_column_roles(sql):
+    """
+    Return ``(table, column, role)`` tuples for the columns ``sql`` filters,
+    joins or sorts on. ``sql`` is a statement with placeholders.
+    """
+    aliases = {}
+    for table, alias in _TABLE_RE.findall(sql):
+        aliases[alias or table] = table
+
+    roles = []
+    parts = _CLAUSE_RE.split(sql)
+    # Splitting on a capturing pattern alternates text and keywords.
+    for keyword, text in zip(parts[1::2], parts[2::2]):
+        role = ' '.join(keyword.upper().split())
+        if role not in _ROLES:
+            continue
+        for alias, column in _COLUMN_RE.findall(text):
+            item = (aliases.get(alias, alias), column, role)
+            if item not in roles:
+                roles.append(item)
+    return tuple(roles)
+
+
+def get_indexed_columns(alias, table):
+    """
+    Return the set of columns that are the first column of an index on
+    ``table``, according to the database and to the models.
+    """
+    columns = set()
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+    except (DatabaseError, NotImplementedError):
+        constraints = {}
+    for constraint in constraints.values():
+        if constraint['columns'] and (
+                constraint['index'] or constraint['unique'] or constraint['primary_key']):
+            columns.add(constraint['columns'][0])
+
+    for model in apps.get_models():
+        opts = model._meta
+        if opts.db_table != table:
+            continue
+        for field in opts.local_fields:
+            if field.db_index or field.unique or field.primary_key:
+                columns.add(field.column)
+        for field_names in list(opts.unique_together) + list(opts.index_together):
+            columns.add(opts.get_field(field_names[0]).column)
+        # Meta.indexes exists in Django >= 1.11.
+        for index in getattr(opts, 'indexes', []):
+            columns.add(opts.get_field(index.fields[0].lstrip('-')).column)
+    return columns
+
+
+def get_index_candidates(queries):
+    """
+    Return the columns that the slow ``queries``, as recorded by the SQL
+    panel, filter, join or sort on and that aren't the first column of any
+    index, sorted by the time spent in the queries that use them.
+    """
+    usages = OrderedDict()
+    for query in queries:
+        if not query.get('is_slow'):
+            continue
+        for table, column, role in get_column_roles(query['raw_sql']):
+            usage = usages.setdefault((query['alias'], table, column), {
+                'alias': query['alias'],
+                'table': table,
+                'column': column,
+                'roles': set(),
+                'count': 0,
+                'duration': 0,
+            })
+            usage['roles'].add(role)
+            usage['count'] += 1
+            usage['duration'] += query['duration']
+
+    indexed = {}
+    candidates = []
+    for (alias, table, column), usage in usages.items():
+        if alias not in connections:
+            continue
+        if (alias, table) not in indexed:
+            indexed[alias, table] = get_indexed_columns(alias, table)
+        if column not in indexed[alias, table]:
+            usage['roles'] = [_ROLES[role] for role in _ROLES if role in usage['roles']]
+            candidates.append(usage)
+    candidates.sort(key=lambda usage: -usage['duration'])
+    return candidates
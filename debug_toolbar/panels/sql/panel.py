@@ -1,19 +1,27 @@
 from __future__ import absolute_import, unicode_literals
 
+import threading
 import uuid
+from array import array
 from collections import defaultdict
 from copy import copy
 
 from django.conf.urls import url
 from django.db import connections
+from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _, ungettext_lazy as __
 
+from debug_toolbar import settings as dt_settings
 from debug_toolbar.panels import Panel
 from debug_toolbar.panels.sql import views
-from debug_toolbar.panels.sql.forms import SQLSelectForm
-from debug_toolbar.panels.sql.tracking import unwrap_cursor, wrap_cursor
+from debug_toolbar.panels.sql.forms import SQLSelectForm, signer
+from debug_toolbar.panels.sql.indexes import get_index_candidates
+from debug_toolbar.panels.sql.tracking import (
+    finalize_query, unwrap_cursor, unwrap_transactions, wrap_cursor,
+    wrap_transactions,
+)
 from debug_toolbar.panels.sql.utils import (
-    contrasting_color_generator, reformat_sql,
+    contrasting_color_generator, reformat_sql, summarize_durations,
 )
 from debug_toolbar.utils import render_stacktrace
 
@@ -59,24 +67,32 @@ class SQLPanel(Panel):
         self._sql_time = 0
         self._num_queries = 0
         self._queries = []
+        self._durations = array(str('d'))
         self._databases = {}
         self._transaction_status = {}
         self._transaction_ids = {}
+        self._events = []
+        self._thread = threading.current_thread()
 
     def get_transaction_id(self, alias):
         if alias not in connections:
             return
-        conn = connections[alias].connection
+        connection = connections[alias]
+        conn = connection.connection
         if not conn:
             return
+        # Worker threads have their own connections and transactions.
+        key = (alias, threading.current_thread().ident)
 
-        if conn.vendor == 'postgresql':
+        if connection.vendor == 'postgresql':
             cur_status = conn.get_transaction_status()
         else:
-            raise ValueError(conn.vendor)
+            # Other drivers don't report the transaction status. Rely on
+            # Django's bookkeeping of atomic blocks instead.
+            cur_status = connection.in_atomic_block
 
-        last_status = self._transaction_status.get(alias)
-        self._transaction_status[alias] = cur_status
+        last_status = self._transaction_status.get(key)
+        self._transaction_status[key] = cur_status
 
         if not cur_status:
             # No available state
@@ -84,14 +100,21 @@ class SQLPanel(Panel):
 
         if cur_status != last_status:
             if cur_status:
-                self._transaction_ids[alias] = uuid.uuid4().hex
+                self._transaction_ids[key] = uuid.uuid4().hex
             else:
-                self._transaction_ids[alias] = None
+                self._transaction_ids[key] = None
+
+        return self._transaction_ids[key]
 
-        return self._transaction_ids[alias]
+    def _tag_thread(self, kwargs):
+        thread = threading.current_thread()
+        if thread is not self._thread:
+            kwargs['thread'] = thread.name
 
     def record(self, alias, **kwargs):
+        self._tag_thread(kwargs)
         self._queries.append((alias, kwargs))
+        self._durations.append(kwargs['duration'])
         if alias not in self._databases:
             self._databases[alias] = {
                 'time_spent': kwargs['duration'],
@@ -103,6 +126,10 @@ class SQLPanel(Panel):
         self._sql_time += kwargs['duration']
         self._num_queries += 1
 
+    def record_event(self, alias, **kwargs):
+        self._tag_thread(kwargs)
+        self._events.append((alias, kwargs))
+
     # Implement the Panel API
 
     nav_title = _("SQL")
@@ -121,11 +148,29 @@ class SQLPanel(Panel):
 
     template = 'debug_toolbar/panels/sql.html'
 
+    @property
+    def content(self):
+        # Formatting SQL is expensive, only do it when the panel is displayed.
+        stats = self.get_stats()
+        # The toolbar is stored when panels are rendered on demand. Then the
+        # SQL views look queries up by index. Otherwise, each query is sent
+        # to them in a form signed with a hash of its SQL and parameters.
+        store_id = self.toolbar.store_id
+        for query in stats.get('queries', []):
+            if query['sql']:
+                query['formatted_sql'] = reformat_sql(query['sql'], query['raw_sql'])
+            if store_id is None and query['params'] and query['is_select']:
+                query['form'] = SQLSelectForm(auto_id=None, initial=copy(query))
+        if store_id is not None:
+            store_id = signer.sign(store_id)
+        return render_to_string(self.template, dict(stats, store_id=store_id))
+
     @classmethod
     def get_urls(cls):
         return [
             url(r'^sql_select/$', views.sql_select, name='sql_select'),
             url(r'^sql_explain/$', views.sql_explain, name='sql_explain'),
+            url(r'^sql_explain_all/$', views.sql_explain_all, name='sql_explain_all'),
             url(r'^sql_profile/$', views.sql_profile, name='sql_profile'),
         ]
 
@@ -133,10 +178,54 @@ class SQLPanel(Panel):
         # This is thread-safe because database connections are thread-local.
         for connection in connections.all():
             wrap_cursor(connection, self)
+            wrap_transactions(connection, self)
 
     def disable_instrumentation(self):
         for connection in connections.all():
             unwrap_cursor(connection)
+            unwrap_transactions(connection)
+
+    def enable_thread_instrumentation(self, parent):
+        # Worker threads get their own connections, wrap them too.
+        self.enable_instrumentation()
+
+    def disable_thread_instrumentation(self, parent):
+        self.disable_instrumentation()
+
+    def get_timeline(self):
+        """
+        Place connection opens, transactions and savepoints on a time axis
+        spanning all the queries and events of the request, grouped by alias.
+        """
+        if not self._events:
+            return []
+        items = [query for alias, query in self._queries] + [
+            event for alias, event in self._events]
+        start_time = min(item['start_time'] for item in items)
+        span = (max(item['stop_time'] for item in items) - start_time) * 1000
+        threshold = dt_settings.get_config()['SQL_WARNING_THRESHOLD']
+        timeline = defaultdict(list)
+        for alias, event in sorted(self._events, key=lambda e: (e[0], e[1]['start_time'])):
+            event['alias'] = alias
+            event['is_slow'] = event['duration'] > threshold
+            try:
+                event['start_offset'] = (
+                    (event['start_time'] - start_time) * 1000 / span * 100)
+                event['width_ratio'] = event['duration'] / span * 100
+            except ZeroDivisionError:
+                event['start_offset'] = 0
+                event['width_ratio'] = 100
+            timeline[alias].append(event)
+        return sorted(timeline.items())
+
+    def get_timeline_events(self):
+        return [{
+            'category': _("SQL"),
+            'label': query['raw_sql'],
+            'start_time': query['start_time'],
+            'stop_time': query['stop_time'],
+            'io': True,
+        } for alias, query in self._queries]
 
     def generate_stats(self, request, response):
         colors = contrasting_color_generator()
@@ -164,15 +253,17 @@ class SQLPanel(Panel):
             trans_id = None
             i = 0
             for alias, query in self._queries:
+                finalize_query(connections[alias], query)
                 query_duplicates[alias][query["raw_sql"]] += 1
 
                 trans_id = query.get('trans_id')
-                last_trans_id = trans_ids.get(alias)
+                trans_key = (alias, query.get('thread'))
+                last_trans_id = trans_ids.get(trans_key)
 
                 if trans_id != last_trans_id:
                     if last_trans_id:
                         self._queries[(i - 1)][1]['ends_trans'] = True
-                    trans_ids[alias] = trans_id
+                    trans_ids[trans_key] = trans_id
                     if trans_id:
                         query['starts_trans'] = True
                 if trans_id:
@@ -186,10 +277,6 @@ class SQLPanel(Panel):
                     query['trans_status'] = get_transaction_status_display(query['vendor'],
                                                                            query['trans_status'])
 
-                query['form'] = SQLSelectForm(auto_id=None, initial=copy(query))
-
-                if query['sql']:
-                    query['sql'] = reformat_sql(query['sql'])
                 query['rgb_color'] = self._databases[alias]['rgb_color']
                 try:
                     query['width_ratio'] = (query['duration'] / self._sql_time) * 100
@@ -234,9 +321,17 @@ class SQLPanel(Panel):
                 alias_info["duplicate_count"] = sum(e[0] for e in query_duplicates[alias].values())
             except KeyError:
                 pass
+            try:
+                alias_info['time_share'] = 100.0 * alias_info['time_spent'] / self._sql_time
+            except ZeroDivisionError:
+                alias_info['time_share'] = 0
 
         self.record_stats({
             'databases': sorted(self._databases.items(), key=lambda x: -x[1]['time_spent']),
             'queries': [q for a, q in self._queries],
             'sql_time': self._sql_time,
+            # Introspecting the indexes is expensive, it's done once.
+            'index_candidates': get_index_candidates(q for a, q in self._queries),
+            'summary': summarize_durations(self._durations),
+            'timeline': self.get_timeline(),
         })
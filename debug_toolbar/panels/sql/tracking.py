@@ -1,14 +1,16 @@
 from __future__ import absolute_import, unicode_literals
 
 import json
+from itertools import islice
 from threading import local
-from time import time
 
 from django.utils import six
 from django.utils.encoding import force_text
 
 from debug_toolbar import settings as dt_settings
-from debug_toolbar.utils import get_stack, get_template_info, tidy_stacktrace
+from debug_toolbar.utils import (
+    get_stack, get_template_context, get_template_node, tidy_stacktrace, timer,
+)
 
 
 class SQLQueryTriggered(Exception):
@@ -51,6 +53,250 @@ def unwrap_cursor(connection):
         del connection.cursor
 
 
+class TransactionTracker(object):
+    """
+    Records when a connection is opened and how long transactions and
+    savepoints are held. It relies on the methods of Django's database
+    wrapper, which makes it independent of the database vendor.
+    """
+    methods = ('connect', 'set_autocommit', 'commit', 'rollback',
+               'savepoint', 'savepoint_commit', 'savepoint_rollback')
+
+    def __init__(self, connection, logger):
+        self.connection = connection
+        # logger must implement a ``record_event`` method
+        self.logger = logger
+        self.original = dict(
+            (name, getattr(connection, name)) for name in self.methods)
+        self.transaction_start = None
+        self.savepoints = {}
+
+    def _record(self, type, start_time, **kwargs):
+        stop_time = timer()
+        self.logger.record_event(
+            self.connection.alias, type=type, start_time=start_time,
+            stop_time=stop_time, duration=(stop_time - start_time) * 1000,
+            **kwargs)
+
+    def connect(self):
+        start_time = timer()
+        try:
+            return self.original['connect']()
+        finally:
+            self._record('connect', start_time)
+
+    def set_autocommit(self, autocommit, *args, **kwargs):
+        if not autocommit and self.connection.get_autocommit():
+            self.transaction_start = timer()
+        return self.original['set_autocommit'](autocommit, *args, **kwargs)
+
+    def _end_transaction(self, outcome):
+        start_time = timer()
+        try:
+            return self.original[outcome]()
+        finally:
+            if self.transaction_start is not None:
+                self._record('transaction', self.transaction_start,
+                             outcome=outcome,
+                             end_duration=(timer() - start_time) * 1000)
+                self.transaction_start = None
+
+    def commit(self):
+        return self._end_transaction('commit')
+
+    def rollback(self):
+        return self._end_transaction('rollback')
+
+    def savepoint(self):
+        start_time = timer()
+        sid = self.original['savepoint']()
+        if sid is not None:
+            self.savepoints[sid] = start_time
+        return sid
+
+    def _end_savepoint(self, sid, outcome):
+        start_time = timer()
+        try:
+            return self.original['savepoint_' + outcome](sid)
+        finally:
+            savepoint_start = self.savepoints.pop(sid, None)
+            if savepoint_start is not None:
+                self._record('savepoint', savepoint_start, name=sid,
+                             outcome=outcome,
+                             end_duration=(timer() - start_time) * 1000)
+
+    def savepoint_commit(self, sid):
+        return self._end_savepoint(sid, 'commit')
+
+    def savepoint_rollback(self, sid):
+        return self._end_savepoint(sid, 'rollback')
+
+
+def wrap_transactions(connection, panel):
+    if not hasattr(connection, '_djdt_transactions'):
+        tracker = TransactionTracker(connection, panel)
+        for name in tracker.methods:
+            setattr(connection, name, getattr(tracker, name))
+        connection._djdt_transactions = tracker
+        return tracker
+
+
+def unwrap_transactions(connection):
+    if hasattr(connection, '_djdt_transactions'):
+        for name in connection._djdt_transactions.methods:
+            delattr(connection, name)
+        del connection._djdt_transactions
+
+
+def _copy_params(params):
+    """
+    Return a shallow copy of the parameters of a query, so that the caller
+    can reuse or modify its own list before the panel is rendered.
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return dict(params)
+    return tuple(params)
+
+
+def _quote_expr(element):
+    if isinstance(element, six.string_types):
+        return "'%s'" % force_text(element).replace("'", "''")
+    else:
+        return repr(element)
+
+
+def _quote_params(params):
+    if not params:
+        return params
+    if isinstance(params, dict):
+        return dict((key, _quote_expr(value))
+                    for key, value in params.items())
+    return list(map(_quote_expr, params))
+
+
+def _decode(param):
+    try:
+        return force_text(param, strings_only=True)
+    except UnicodeDecodeError:
+        return '(encoded string)'
+
+
+def _encode_params(params):
+    try:
+        return json.dumps(list(map(_decode, params)))
+    except Exception:
+        return ''  # object not JSON serializable
+
+
+# These backends read the interpolated query back from the cursor, which is
+# only possible right after it ran. Other backends rebuild it from the SQL and
+# the parameters without the cursor, so it's left out of the time spent per
+# query and done when the panel is rendered. (That's string formatting, except
+# for SQLite on Django 1.10, which quotes the parameters with a query.)
+LIVE_CURSOR_VENDORS = ('mysql', 'oracle', 'postgresql')
+
+
+def finalize_query(connection, query):
+    """
+    Derive the values that aren't computed while the query runs: the SQL
+    with interpolated parameters, the JSON-encoded parameters and the flags.
+    """
+    raw_sql = query['raw_sql']
+    raw_params = query.pop('raw_params', None)
+    if 'sql' not in query:
+        try:
+            query['sql'] = connection.ops.last_executed_query(
+                None, raw_sql, _quote_params(raw_params))
+        except Exception:
+            query['sql'] = raw_sql
+    query['params'] = _encode_params(raw_params)
+    if 'batch_rows' in query:
+        rows = query['batch_rows']
+        query['batch_time_per_row'] = query['duration'] / rows if rows else 0
+        query['batch_params'] = [
+            _encode_params(params) for params in query.pop('batch_sample')]
+    query['is_slow'] = (
+        query['duration'] > dt_settings.get_config()['SQL_WARNING_THRESHOLD'])
+    query['is_select'] = raw_sql.lower().strip().startswith('select')
+    fetch = query.pop('fetch', None)
+    if fetch is not None:
+        query['rows'] = fetch.rows
+        query['fetch_duration'] = fetch.duration
+        query['fetch_bytes'] = fetch.bytes
+        query['is_many_rows'] = (
+            fetch.rows > dt_settings.get_config()['SQL_ROWS_WARNING_THRESHOLD'])
+    if query['template_info'] is not None:
+        try:
+            query['template_info'] = get_template_context(*query['template_info'])
+        except Exception:
+            query['template_info'] = None
+    return query
+
+
+class ParamListSample(object):
+    """
+    Counts the rows of an executemany() parameter list and keeps the first
+    few of them, without copying the whole list.
+    """
+    size = 5
+
+    def __init__(self, param_list):
+        try:
+            self.count = len(param_list)
+        except TypeError:
+            # An iterator can only be consumed once, by the database.
+            self.count = 0
+            self.rows = []
+            self.param_list = self._consume(param_list)
+        else:
+            self.rows = list(map(_copy_params, islice(param_list, self.size)))
+            self.param_list = param_list
+
+    def _consume(self, param_list):
+        for params in param_list:
+            if self.count < self.size:
+                self.rows.append(_copy_params(params))
+            self.count += 1
+            yield params
+
+
+def _estimate_row_size(row):
+    if isinstance(row, dict):
+        row = row.values()
+    return sum(
+        len(value) if isinstance(value, (six.binary_type, six.text_type)) else 8
+        for value in row if value is not None)
+
+
+class FetchStats(object):
+    """
+    Tracks the rows fetched after a query and the time spent fetching them.
+    The size of the result is extrapolated from the first few rows.
+    """
+    sample_size = 10
+
+    def __init__(self):
+        self.rows = 0
+        self.duration = 0
+        self._sample_rows = 0
+        self._sample_bytes = 0
+
+    def add(self, start_time, rows):
+        self.duration += (timer() - start_time) * 1000
+        self.rows += len(rows)
+        for row in rows[:self.sample_size - self._sample_rows]:
+            self._sample_rows += 1
+            self._sample_bytes += _estimate_row_size(row)
+
+    @property
+    def bytes(self):
+        if not self._sample_rows:
+            return 0
+        return self.rows * self._sample_bytes // self._sample_rows
+
+
 class ExceptionCursorWrapper(object):
     """
     Wraps a cursor and raises an exception on any operation.
@@ -74,65 +320,57 @@ class NormalCursorWrapper(object):
         self.db = db
         # logger must implement a ``record`` method
         self.logger = logger
+        # Rows fetched for the last query executed on this cursor
+        self.fetch = None
 
-    def _quote_expr(self, element):
-        if isinstance(element, six.string_types):
-            return "'%s'" % force_text(element).replace("'", "''")
-        else:
-            return repr(element)
-
-    def _quote_params(self, params):
-        if not params:
-            return params
-        if isinstance(params, dict):
-            return dict((key, self._quote_expr(value))
-                        for key, value in params.items())
-        return list(map(self._quote_expr, params))
-
-    def _decode(self, param):
-        try:
-            return force_text(param, strings_only=True)
-        except UnicodeDecodeError:
-            return '(encoded string)'
-
-    def _record(self, method, sql, params):
-        start_time = time()
+    def _record(self, method, sql, params, batch=None):
+        start_time = timer()
         try:
             return method(sql, params)
         finally:
-            stop_time = time()
+            stop_time = timer()
             duration = (stop_time - start_time) * 1000
             if dt_settings.get_config()['ENABLE_STACKTRACES']:
                 stacktrace = tidy_stacktrace(reversed(get_stack()))
             else:
                 stacktrace = []
-            _params = ''
-            try:
-                _params = json.dumps(list(map(self._decode, params)))
-            except Exception:
-                pass  # object not JSON serializable
-
-            template_info = get_template_info()
 
             alias = getattr(self.db, 'alias', 'default')
             conn = self.db.connection
-            vendor = getattr(conn, 'vendor', 'unknown')
+            vendor = getattr(self.db, 'vendor', 'unknown')
+
+            if batch is not None:
+                # Display the first row of the batch in place of the params.
+                params = batch.rows[0] if batch.rows else None
+            else:
+                params = _copy_params(params)
 
+            # Anything that can be derived later is left to finalize_query()
+            # to keep the overhead per query low.
             params = {
                 'vendor': vendor,
                 'alias': alias,
-                'sql': self.db.ops.last_executed_query(
-                    self.cursor, sql, self._quote_params(params)),
                 'duration': duration,
                 'raw_sql': sql,
-                'params': _params,
+                'raw_params': params,
                 'stacktrace': stacktrace,
                 'start_time': start_time,
                 'stop_time': stop_time,
-                'is_slow': duration > dt_settings.get_config()['SQL_WARNING_THRESHOLD'],
-                'is_select': sql.lower().strip().startswith('select'),
-                'template_info': template_info,
+                'template_info': get_template_node(),
+                'trans_id': self.logger.get_transaction_id(alias),
             }
+            if batch is not None:
+                params['batch_rows'] = batch.count
+                params['batch_sample'] = batch.rows
+                self.fetch = None
+            else:
+                params['fetch'] = self.fetch = FetchStats()
+
+            # The driver's copy of a batch is the whole multi-row statement,
+            # the SQL of the first row is rebuilt instead.
+            if vendor in LIVE_CURSOR_VENDORS and batch is None:
+                params['sql'] = self.db.ops.last_executed_query(
+                    self.cursor, sql, _quote_params(params['raw_params']))
 
             if vendor == 'postgresql':
                 # If an erroneous query was ran on the connection, it might
@@ -143,13 +381,11 @@ class NormalCursorWrapper(object):
                 except conn.InternalError:
                     iso_level = 'unknown'
                 params.update({
-                    'trans_id': self.logger.get_transaction_id(alias),
                     'trans_status': conn.get_transaction_status(),
                     'iso_level': iso_level,
                     'encoding': conn.encoding,
                 })
 
-            # We keep `sql` to maintain backwards compatibility
             self.logger.record(**params)
 
     def callproc(self, procname, params=None):
@@ -159,13 +395,70 @@ class NormalCursorWrapper(object):
         return self._record(self.cursor.execute, sql, params)
 
     def executemany(self, sql, param_list):
-        return self._record(self.cursor.executemany, sql, param_list)
+        batch = ParamListSample(param_list)
+        return self._record(self.cursor.executemany, sql, batch.param_list,
+                            batch=batch)
+
+    def fetchone(self):
+        if self.fetch is None:
+            return self.cursor.fetchone()
+        start_time = timer()
+        row = self.cursor.fetchone()
+        self.fetch.add(start_time, () if row is None else (row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        if self.fetch is None:
+            return self.cursor.fetchmany(*args, **kwargs)
+        start_time = timer()
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.fetch.add(start_time, rows)
+        return rows
+
+    def fetchall(self):
+        if self.fetch is None:
+            return self.cursor.fetchall()
+        start_time = timer()
+        rows = self.cursor.fetchall()
+        self.fetch.add(start_time, rows)
+        return rows
+
+    # Django reads these after most queries. Defining them avoids the failed
+    # attribute lookup that precedes every call to __getattr__().
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        return self.cursor.close()
 
     def __getattr__(self, attr):
         return getattr(self.cursor, attr)
 
     def __iter__(self):
-        return iter(self.cursor)
+        if self.fetch is None:
+            return iter(self.cursor)
+        return self._iter_rows(self.fetch)
+
+    def _iter_rows(self, fetch):
+        rows = iter(self.cursor)
+        while True:
+            start_time = timer()
+            try:
+                row = next(rows)
+            except StopIteration:
+                fetch.add(start_time, ())
+                return
+            fetch.add(start_time, (row,))
+            yield row
 
     def __enter__(self):
         return self
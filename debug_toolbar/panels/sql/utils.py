@@ -1,9 +1,14 @@
 from __future__ import absolute_import, unicode_literals
 
+import json
+import math
 import re
+from bisect import bisect_left
 
 import sqlparse
+from django.utils import six
 from django.utils.html import escape
+from django.utils.lru_cache import lru_cache
 from sqlparse import tokens as T
 
 
@@ -20,13 +25,78 @@ class BoldKeywordFilter:
                 yield T.Text, '</strong>'
 
 
-def reformat_sql(sql):
+# Statements longer than this aren't cached, so that bulk inserts don't stay in
+# memory.
+FORMAT_CACHE_MAX_LENGTH = 10000
+
+
+def _format_sql(sql):
     stack = sqlparse.engine.FilterStack()
     stack.preprocess.append(BoldKeywordFilter())  # add our custom filter
     stack.postprocess.append(sqlparse.filters.SerializerUnicode())  # tokens -> strings
     return swap_fields(''.join(stack.run(sql)))
 
 
+# Most pages repeat the same few statements many times. Tokenizing is slow so
+# the result is cached across requests.
+_format_sql_cached = lru_cache(maxsize=1000)(_format_sql)
+
+
+def _format_statement(sql):
+    if len(sql) > FORMAT_CACHE_MAX_LENGTH:
+        return _format_sql(sql)
+    return _format_sql_cached(sql)
+
+
+# Placeholders and escaped percent signs of a statement before interpolation.
+_placeholder_re = re.compile(r'%(?:\(\w+\))?s|%%')
+
+
+def _split_values(sql, raw_sql):
+    """
+    Return the parameters as they were interpolated in ``sql`` by matching it
+    against the text around the placeholders of ``raw_sql``, or ``None``.
+    """
+    pieces = [piece.replace('%%', '%') for piece in
+              re.split(r'%(?:\(\w+\))?s', raw_sql)]
+    if (len(pieces) < 2 or not sql.startswith(pieces[0]) or
+            not sql.endswith(pieces[-1])):
+        return None
+    values = []
+    start = len(pieces[0])
+    for piece in pieces[1:-1]:
+        end = sql.find(piece, start)
+        if end < 0:
+            return None
+        values.append(sql[start:end])
+        start = end + len(piece)
+    end = len(sql) - len(pieces[-1])
+    if end < start:
+        return None
+    values.append(sql[start:end])
+    return values
+
+
+def reformat_sql(sql, raw_sql=None):
+    """
+    Format ``sql`` as HTML.
+
+    When ``raw_sql``, the statement before its parameters were interpolated,
+    is given, it's formatted instead and the parameters are substituted
+    afterwards, so that queries that only differ by their parameters, like
+    those of a loop, share a cache entry.
+    """
+    values = None
+    if raw_sql is not None and raw_sql != sql:
+        values = _split_values(sql, raw_sql)
+    if values is None:
+        return _format_statement(sql)
+    values = iter(values)
+    return _placeholder_re.sub(
+        lambda match: '%' if match.group() == '%%' else escape(next(values)),
+        _format_statement(raw_sql))
+
+
 def swap_fields(sql):
     expr = r'SELECT</strong> (...........*?) <strong>FROM'
     subs = (r'SELECT</strong> '
@@ -36,6 +106,175 @@ def swap_fields(sql):
     return re.sub(expr, subs, sql)
 
 
+def fingerprint_sql(sql):
+    """
+    Normalize a statement with placeholders, so that queries that only differ
+    by whitespace or by the length of their IN lists share a fingerprint.
+    """
+    sql = ' '.join(sql.split())
+    return re.sub(r'\((?:%s, )*%s\)', '(%s, ...)', sql)
+
+
+def explain_query(connection, cursor, sql, params):
+    """
+    Run EXPLAIN for ``sql`` on ``cursor``. Return the headers and the rows of
+    the plan.
+    """
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        # SQLite's EXPLAIN dumps the low-level opcodes generated for a query;
+        # EXPLAIN QUERY PLAN dumps a more human-readable summary
+        # See http://www.sqlite.org/lang_explain.html for details
+        cursor.execute("EXPLAIN QUERY PLAN %s" % (sql,), params)
+    elif vendor == 'postgresql':
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) %s" % (sql,), params)
+    else:
+        cursor.execute("EXPLAIN %s" % (sql,), params)
+    headers = [d[0] for d in cursor.description]
+    return headers, cursor.fetchall()
+
+
+# Plan nodes that take at least this share of the execution time by
+# themselves, or whose row estimate is off by at least this factor, are
+# highlighted.
+EXPENSIVE_NODE_RATIO = 0.2
+MISESTIMATE_RATIO = 10
+
+
+def get_plan_tree(vendor, result):
+    """
+    Return the root node of a structured query plan, if the database provides
+    one, or ``None``.
+    """
+    if vendor != 'postgresql':
+        return None
+    plan = result[0][0]
+    # psycopg2 only decodes JSON for json columns, EXPLAIN returns text.
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    plan = plan[0]
+    # Total Runtime was renamed to Execution Time in PostgreSQL 9.4.
+    total_time = plan.get('Execution Time', plan.get('Total Runtime'))
+    if total_time is None:
+        total_time = plan['Plan'].get('Actual Total Time', 0)
+    return _get_plan_node(plan['Plan'], total_time)
+
+
+def _get_plan_node(node, total_time):
+    loops = node.get('Actual Loops', 1)
+    children = [_get_plan_node(child, total_time) for child in node.get('Plans', [])]
+    # Times and rows are averages per loop.
+    time = node.get('Actual Total Time', 0) * loops
+    self_time = max(time - sum(child['time'] for child in children), 0)
+    actual_rows = node.get('Actual Rows', 0) * loops
+    plan_rows = node.get('Plan Rows', 0) * loops
+    misestimate = float(max(actual_rows, 1)) / max(plan_rows, 1)
+    if misestimate < 1:
+        misestimate = 1 / misestimate
+    return {
+        'type': node['Node Type'],
+        'relation': node.get('Relation Name'),
+        'index': node.get('Index Name'),
+        'conditions': [
+            (key, node[key]) for key in (
+                'Index Cond', 'Recheck Cond', 'Hash Cond', 'Merge Cond',
+                'Join Filter', 'Filter', 'Sort Key', 'Group Key')
+            if key in node],
+        'loops': loops,
+        'time': time,
+        'self_time': self_time,
+        'actual_rows': actual_rows,
+        'plan_rows': plan_rows,
+        'misestimate': misestimate,
+        'shared_hit': node.get('Shared Hit Blocks', 0),
+        'shared_read': node.get('Shared Read Blocks', 0),
+        'local_hit': node.get('Local Hit Blocks', 0),
+        'local_read': node.get('Local Read Blocks', 0),
+        'is_expensive': total_time > 0 and self_time >= EXPENSIVE_NODE_RATIO * total_time,
+        'is_misestimated': misestimate >= MISESTIMATE_RATIO,
+        'children': children,
+    }
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node['children']:
+        for descendant in iter_plan_nodes(child):
+            yield descendant
+
+
+def find_full_scans(vendor, headers, result):
+    """
+    Return the steps of a query plan that read a whole table, which usually
+    means that an index is missing.
+    """
+    scans = []
+    if vendor == 'sqlite':
+        for row in result:
+            # SCAN TABLE <name> (SCAN <name> in SQLite >= 3.36) unless it's
+            # followed by USING [COVERING] INDEX.
+            match = re.match(r'SCAN (?:TABLE )?(\S+)', row[-1])
+            if (match and ' USING ' not in row[-1] and
+                    match.group(1) not in ('CONSTANT', 'SUBQUERY')):
+                scans.append(row[-1])
+    elif vendor == 'postgresql':
+        for node in iter_plan_nodes(get_plan_tree(vendor, result)):
+            if node['type'] == 'Seq Scan':
+                scans.append('Seq Scan on %s' % node['relation'])
+    elif vendor == 'mysql':
+        columns = [header.lower() for header in headers]
+        for row in result:
+            step = dict(zip(columns, row))
+            if step.get('type') == 'ALL':
+                scans.append(step.get('table'))
+    return scans
+
+
+# Upper bounds, in milliseconds, of the buckets of the duration histogram.
+DURATION_BUCKETS = (0.1, 1, 10, 100, 1000)
+DURATION_PERCENTILES = (50, 90, 99)
+
+
+def summarize_durations(durations):
+    """
+    Return percentiles and a histogram with logarithmic buckets of
+    ``durations``, a sequence of query durations in milliseconds.
+
+    The durations are sorted once, then percentiles are read by rank and
+    bucket bounds found by bisection, so this stays cheap for many queries.
+    """
+    durations = sorted(durations)
+    count = len(durations)
+    if not count:
+        return None
+
+    percentiles = [
+        (p, durations[max(int(math.ceil(p / 100.0 * count)) - 1, 0)])
+        for p in DURATION_PERCENTILES]
+
+    buckets = []
+    start = 0
+    bounds = (0,) + DURATION_BUCKETS + (None,)
+    for low, high in zip(bounds, bounds[1:]):
+        stop = count if high is None else bisect_left(durations, high, start)
+        buckets.append({
+            'low': low,
+            'high': high,
+            'count': stop - start,
+            'time_spent': sum(durations[start:stop]),
+        })
+        start = stop
+    top = max(bucket['count'] for bucket in buckets)
+    for bucket in buckets:
+        bucket['width_ratio'] = 100.0 * bucket['count'] / top
+
+    return {
+        'percentiles': percentiles,
+        'max': durations[-1],
+        'buckets': buckets,
+    }
+
+
 def contrasting_color_generator():
     """
     Generate constrasting colors by varying most significant bit of RGB first,
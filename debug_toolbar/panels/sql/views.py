@@ -1,63 +1,133 @@
 from __future__ import absolute_import, unicode_literals
 
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.core import signing
+from django.db import DatabaseError, connections, transaction
 from django.http import HttpResponseBadRequest
 from django.shortcuts import render_to_response
 from django.views.decorators.csrf import csrf_exempt
 
-from debug_toolbar.panels.sql.forms import SQLSelectForm
+from debug_toolbar import settings as dt_settings
+from debug_toolbar.panels.sql.forms import get_sql_form, signer
+from debug_toolbar.panels.sql.utils import (
+    explain_query, find_full_scans, fingerprint_sql, get_plan_tree,
+    reformat_sql,
+)
+from debug_toolbar.toolbar import DebugToolbar
+
+# Plans computed by sql_explain_all, by (alias, fingerprint). Pages usually
+# run the same statements on every request, so they're kept across requests.
+PLAN_CACHE_SIZE = 1000
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def _get_plan(key):
+    with _plans_lock:
+        return _plans.get(key)
+
+
+def _store_plan(key, plan):
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
 
 
 @csrf_exempt
 def sql_select(request):
-    """Returns the output of the SQL SELECT statement"""
-    form = SQLSelectForm(request.POST or None)
+    """Returns one page of the output of the SQL SELECT statement"""
+    form = get_sql_form(request.POST or None)
 
     if form.is_valid():
         sql = form.cleaned_data['raw_sql']
         params = form.cleaned_data['params']
-        cursor = form.cursor
-        cursor.execute(sql, params)
-        headers = [d[0] for d in cursor.description]
-        result = cursor.fetchall()
-        cursor.close()
+        page = form.cleaned_data['page'] or 1
+        page_size = dt_settings.get_config()['SQL_SELECT_PAGE_SIZE']
+        # Fetch one row more than the page size to know whether there's a
+        # next page.
+        headers, result = _fetch_page(
+            form.connection, sql, params, (page - 1) * page_size, page_size + 1)
         context = {
-            'result': result,
+            'result': result[:page_size],
             'sql': form.reformat_sql(),
             'duration': form.cleaned_data['duration'],
             'headers': headers,
             'alias': form.cleaned_data['alias'],
+            'form': form,
+            'page': page,
+            'first_row': (page - 1) * page_size + 1,
+            'last_row': (page - 1) * page_size + len(result[:page_size]),
+            'previous_page': page - 1,
+            'next_page': page + 1 if len(result) > page_size else None,
         }
         # Using render_to_response avoids running global context processors.
         return render_to_response('debug_toolbar/panels/sql_select.html', context)
     return HttpResponseBadRequest('Form errors')
 
 
+def _fetch_page(connection, sql, params, offset, limit):
+    """
+    Return the column names and at most ``limit`` rows of ``sql``, starting
+    at row ``offset``, without transferring the other rows when possible.
+    """
+    if connection.vendor == 'postgresql':
+        # Named cursors are server-side cursors, which only exist inside a
+        # transaction. scroll() skips rows on the server.
+        with transaction.atomic(using=connection.alias):
+            connection.ensure_connection()
+            cursor = connection.connection.cursor(name='djdt_%s' % uuid.uuid4().hex)
+            try:
+                cursor.execute(sql, params)
+                if offset:
+                    cursor.scroll(offset)
+                result = cursor.fetchmany(limit)
+                return [d[0] for d in cursor.description], result
+            finally:
+                cursor.close()
+
+    # Other drivers load the whole result when the query is executed, so the
+    # database applies the limit.
+    paged_sql = 'SELECT * FROM (%s) djdt_page LIMIT %d OFFSET %d' % (
+        sql.strip().rstrip(';'), limit, offset)
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(paged_sql, params)
+                return [d[0] for d in cursor.description], cursor.fetchmany(limit)
+    except DatabaseError:
+        # The derived table is rejected, for instance when columns of joined
+        # tables have the same name on MySQL, or LIMIT isn't supported.
+        pass
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        skip = offset
+        while skip > 0:
+            rows = cursor.fetchmany(min(skip, limit))
+            if not rows:
+                break
+            skip -= len(rows)
+        return [d[0] for d in cursor.description], cursor.fetchmany(limit)
+
+
 @csrf_exempt
 def sql_explain(request):
     """Returns the output of the SQL EXPLAIN on the given query"""
-    form = SQLSelectForm(request.POST or None)
+    form = get_sql_form(request.POST or None)
 
     if form.is_valid():
         sql = form.cleaned_data['raw_sql']
         params = form.cleaned_data['params']
-        vendor = form.connection.vendor
         cursor = form.cursor
-
-        if vendor == 'sqlite':
-            # SQLite's EXPLAIN dumps the low-level opcodes generated for a query;
-            # EXPLAIN QUERY PLAN dumps a more human-readable summary
-            # See http://www.sqlite.org/lang_explain.html for details
-            cursor.execute("EXPLAIN QUERY PLAN %s" % (sql,), params)
-        elif vendor == 'postgresql':
-            cursor.execute("EXPLAIN ANALYZE %s" % (sql,), params)
-        else:
-            cursor.execute("EXPLAIN %s" % (sql,), params)
-
-        headers = [d[0] for d in cursor.description]
-        result = cursor.fetchall()
+        headers, result = explain_query(form.connection, cursor, sql, params)
         cursor.close()
         context = {
             'result': result,
+            'plan': get_plan_tree(form.connection.vendor, result),
             'sql': form.reformat_sql(),
             'duration': form.cleaned_data['duration'],
             'headers': headers,
@@ -68,10 +138,82 @@ def sql_explain(request):
     return HttpResponseBadRequest('Form errors')
 
 
+@csrf_exempt
+def sql_explain_all(request):
+    """Returns the output of the SQL EXPLAIN on every distinct SELECT of a request"""
+    try:
+        toolbar = DebugToolbar.fetch(signer.unsign(request.POST.get('store_id', '')))
+    except signing.BadSignature:
+        toolbar = None
+    if toolbar is None:
+        return HttpResponseBadRequest('Data unavailable')
+
+    statements = OrderedDict()
+    for query in toolbar.get_panel_by_id('SQLPanel').get_stats().get('queries', []):
+        if not query['is_select'] or query['alias'] not in connections:
+            continue
+        key = (query['alias'], fingerprint_sql(query['raw_sql']))
+        if key in statements:
+            statements[key]['count'] += 1
+            statements[key]['duration'] += query['duration']
+        else:
+            statements[key] = {
+                'alias': query['alias'],
+                'query': query,
+                'sql': reformat_sql(query['sql'], query['raw_sql']),
+                'count': 1,
+                'duration': query['duration'],
+            }
+
+    refresh = 'refresh' in request.POST
+    cursors = {}
+    try:
+        for key, statement in statements.items():
+            plan = None if refresh else _get_plan(key)
+            if plan is None:
+                # The lock isn't held while EXPLAIN runs, concurrent requests
+                # may both compute the plan of a statement.
+                plan = _explain(statement['query'], cursors)
+                if 'error' not in plan:
+                    _store_plan(key, plan)
+            statement.update(plan)
+    finally:
+        for cursor in cursors.values():
+            cursor.close()
+
+    context = {
+        # Statements that read whole tables first, then the slowest.
+        'statements': sorted(
+            statements.values(),
+            key=lambda s: (not s.get('full_scans'), -s['duration'])),
+        'store_id': request.POST['store_id'],
+    }
+    # Using render_to_response avoids running global context processors.
+    return render_to_response('debug_toolbar/panels/sql_explain_all.html', context)
+
+
+def _explain(query, cursors):
+    connection = connections[query['alias']]
+    if query['alias'] not in cursors:
+        cursors[query['alias']] = connection.cursor()
+    try:
+        params = json.loads(query['params']) if query['params'] else []
+        headers, result = explain_query(
+            connection, cursors[query['alias']], query['raw_sql'], params)
+    except (ValueError, DatabaseError) as exc:
+        return {'error': exc}
+    return {
+        'headers': headers,
+        'result': result,
+        'plan': get_plan_tree(connection.vendor, result),
+        'full_scans': find_full_scans(connection.vendor, headers, result),
+    }
+
+
 @csrf_exempt
 def sql_profile(request):
     """Returns the output of running the SQL and getting the profiling statistics"""
-    form = SQLSelectForm(request.POST or None)
+    form = get_sql_form(request.POST or None)
 
     if form.is_valid():
         sql = form.cleaned_data['raw_sql']
@@ -111,6 +111,12 @@ class StaticFilesPanel(panels.Panel):
                          "%(num_used)s files used",
                          num_used) % {'num_used': num_used}
 
+    def enable_thread_instrumentation(self, parent):
+        collector.clear_collection()
+
+    def disable_thread_instrumentation(self, parent):
+        collector.merge_collection(parent)
+
     def process_request(self, request):
         collector.clear_collection()
 
@@ -10,7 +10,6 @@ from django.conf.urls import url
 from django.db.models.query import QuerySet, RawQuerySet
 from django.template import RequestContext, Template
 from django.test.signals import template_rendered
-from django.test.utils import instrumented_test_render
 from django.utils import six
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
@@ -18,6 +17,7 @@ from django.utils.translation import ugettext_lazy as _
 from debug_toolbar.panels import Panel
 from debug_toolbar.panels.sql.tracking import SQLQueryTriggered, recording
 from debug_toolbar.panels.templates import views
+from debug_toolbar.utils import timer
 
 # Monkey-patch to enable the template_rendered signal. The receiver returns
 # immediately when the panel is disabled to keep the overhead small.
@@ -25,9 +25,24 @@ from debug_toolbar.panels.templates import views
 # Code taken and adapted from Simon Willison and Django Snippets:
 # http://www.djangosnippets.org/snippets/766/
 
-if Template._render != instrumented_test_render:
+
+def _instrumented_render(self, context):
+    """
+    Like django.test.utils.instrumented_test_render, and also reports when
+    rendering starts and ends in the ``timing`` dict sent with the signal.
+    """
+    timing = {}
+    template_rendered.send(sender=self, template=self, context=context, timing=timing)
+    timing['start_time'] = timer()
+    try:
+        return self.nodelist.render(context)
+    finally:
+        timing['stop_time'] = timer()
+
+
+if Template._render != _instrumented_render:
     Template.original_render = Template._render
-    Template._render = instrumented_test_render
+    Template._render = _instrumented_render
 
 
 # Monkey-patch to store items added by template context processors. The
@@ -152,6 +167,14 @@ class TemplatesPanel(Panel):
     def disable_instrumentation(self):
         template_rendered.disconnect(self._store_template_info)
 
+    def get_timeline_events(self):
+        return [{
+            'category': _("Template"),
+            'label': template_data['template'].name or '',
+            'start_time': template_data['timing']['start_time'],
+            'stop_time': template_data['timing']['stop_time'],
+        } for template_data in self.templates if 'stop_time' in template_data.get('timing', {})]
+
     def generate_stats(self, request, response):
         template_context = []
         for template_data in self.templates:
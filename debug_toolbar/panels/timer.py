@@ -1,11 +1,10 @@
 from __future__ import absolute_import, unicode_literals
 
-import time
-
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 
 from debug_toolbar.panels import Panel
+from debug_toolbar.utils import timer
 
 try:
     import resource     # Not available on Win32 systems
@@ -32,33 +31,113 @@ class TimerPanel(Panel):
         else:
             return ''
 
-    has_content = resource is not None
-
     title = _("Time")
 
     template = 'debug_toolbar/panels/timer.html'
 
+    # Periods longer than this without any I/O are highlighted in the timeline.
+    GAP_THRESHOLD = 1   # milliseconds
+
     @property
     def content(self):
         stats = self.get_stats()
-        rows = (
-            (_("User CPU time"), _("%(utime)0.3f msec") % stats),
-            (_("System CPU time"), _("%(stime)0.3f msec") % stats),
-            (_("Total CPU time"), _("%(total)0.3f msec") % stats),
-            (_("Elapsed time"), _("%(total_time)0.3f msec") % stats),
-            (_("Context switches"), _("%(vcsw)d voluntary, %(ivcsw)d involuntary") % stats),
-        )
-        return render_to_string(self.template, {'rows': rows})
+        context = {}
+        if 'utime' in stats:
+            context['rows'] = (
+                (_("User CPU time"), _("%(utime)0.3f msec") % stats),
+                (_("System CPU time"), _("%(stime)0.3f msec") % stats),
+                (_("Total CPU time"), _("%(total)0.3f msec") % stats),
+                (_("Elapsed time"), _("%(total_time)0.3f msec") % stats),
+                (_("Context switches"), _("%(vcsw)d voluntary, %(ivcsw)d involuntary") % stats),
+            )
+        # Other panels contribute events once they have generated their
+        # stats, so the timeline is only built when the panel is displayed.
+        if hasattr(self, '_stop_time'):
+            context.update(self.get_timeline())
+        return render_to_string(self.template, context)
 
     def process_request(self, request):
-        self._start_time = time.time()
-        if self.has_content:
+        self._start_time = timer()
+        if resource is not None:
             self._start_rusage = resource.getrusage(resource.RUSAGE_SELF)
 
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._view_start_time = timer()
+
+    def process_response(self, request, response):
+        self._view_stop_time = timer()
+
+    def get_timeline_events(self):
+        # Phases of the request, as seen by the toolbar's middleware.
+        marks = [
+            (_("Request"), getattr(self, '_start_time', None)),
+            (_("View"), getattr(self, '_view_start_time', None)),
+            (_("Response"), getattr(self, '_view_stop_time', None)),
+            (None, getattr(self, '_stop_time', None)),
+        ]
+        marks = [(label, time) for label, time in marks if time is not None]
+        return [{
+            'category': _("Phase"),
+            'label': label,
+            'start_time': start_time,
+            'stop_time': stop_time,
+        } for (label, start_time), (_next, stop_time) in zip(marks, marks[1:])]
+
+    def get_timeline(self):
+        """
+        Place the events of all panels on a waterfall spanning the request and
+        find the periods that weren't spent in any instrumented I/O.
+        """
+        events = []
+        for panel in self.toolbar.enabled_panels:
+            events.extend(panel.get_timeline_events())
+        if not events:
+            return {}
+        start_time = min(event['start_time'] for event in events)
+        stop_time = max(event['stop_time'] for event in events)
+
+        unaccounted_time = 0
+        cursor = start_time
+        io = sorted((e['start_time'], e['stop_time']) for e in events if e.get('io'))
+        for io_start_time, io_stop_time in io + [(stop_time, stop_time)]:
+            if io_start_time > cursor:
+                duration = (io_start_time - cursor) * 1000
+                unaccounted_time += duration
+                if duration >= self.GAP_THRESHOLD:
+                    events.append({
+                        'category': _("No I/O"),
+                        'label': '',
+                        'start_time': cursor,
+                        'stop_time': io_start_time,
+                        'is_gap': True,
+                    })
+            cursor = max(cursor, io_stop_time)
+
+        span = stop_time - start_time
+        # Enclosing events come first, for instance phases before their events.
+        events.sort(key=lambda e: (e['start_time'], -e['stop_time']))
+        for event in events:
+            event['offset'] = (event['start_time'] - start_time) * 1000
+            event['duration'] = (event['stop_time'] - event['start_time']) * 1000
+            if span:
+                left = (event['start_time'] - start_time) / span * 100
+                width = (event['stop_time'] - event['start_time']) / span * 100
+                event['start_offset'] = left
+                event['width_ratio_relative'] = 100 * width / (100 - left) if left < 100 else 0
+            else:
+                event['start_offset'] = 0
+                event['width_ratio_relative'] = 100
+        return {
+            'events': events,
+            'total_time': span * 1000,
+            'unaccounted_time': unaccounted_time,
+        }
+
     def generate_stats(self, request, response):
         stats = {}
+        self._stop_time = timer()
         if hasattr(self, '_start_time'):
-            stats['total_time'] = (time.time() - self._start_time) * 1000
+            stats['total_time'] = (self._stop_time - self._start_time) * 1000
         if hasattr(self, '_start_rusage'):
             self._end_rusage = resource.getrusage(resource.RUSAGE_SELF)
             stats['utime'] = 1000 * self._elapsed_ru('ru_utime')
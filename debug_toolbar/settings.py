@@ -15,6 +15,7 @@ from django.utils.lru_cache import lru_cache
 
 CONFIG_DEFAULTS = {
     # Toolbar options
+    'BUDGETS': {},
     'DISABLE_PANELS': set(['debug_toolbar.panels.redirects.RedirectsPanel']),
     'INSERT_BEFORE': '</body>',
     'JQUERY_URL': '//ajax.googleapis.com/ajax/libs/jquery/2.1.4/jquery.min.js',
@@ -24,6 +25,7 @@ CONFIG_DEFAULTS = {
     'SHOW_COLLAPSED': False,
     'SHOW_TOOLBAR_CALLBACK': 'debug_toolbar.middleware.show_toolbar',
     # Panel options
+    'CACHE_SIZE_WARNING_THRESHOLD': 100 * 1024,   # bytes
     'EXTRA_SIGNALS': [],
     'ENABLE_STACKTRACES': True,
     'HIDE_IN_STACKTRACES': (
@@ -34,7 +36,12 @@ CONFIG_DEFAULTS = {
         'django',
     ),
     'PROFILER_MAX_DEPTH': 10,
+    'PROFILER_SAMPLE_INTERVAL': 1,   # milliseconds
+    'PROFILER_SAMPLING': False,
+    'PROFILER_WHOLE_REQUEST': False,
     'SHOW_TEMPLATE_CONTEXT': True,
+    'SQL_ROWS_WARNING_THRESHOLD': 1000,
+    'SQL_SELECT_PAGE_SIZE': 100,
     'SQL_WARNING_THRESHOLD': 500,   # milliseconds
 }
 
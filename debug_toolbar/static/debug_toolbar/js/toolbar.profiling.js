@@ -17,5 +17,45 @@
             subcalls.hide();
         }
     });
+    // Clicking a frame of the flame graph zooms on it: its callees fill the
+    // width, its callers are stretched and other frames are hidden. Clicking
+    // it again zooms out.
+    function zoomFlameGraph(graph, start, size, depth) {
+        var epsilon = 1e-6;
+        graph.find('.djdt-flame-frame').each(function() {
+            var frame = $(this),
+                frameStart = frame.data('start'),
+                frameSize = frame.data('size'),
+                frameDepth = frame.data('depth');
+            if (frameDepth >= depth && frameStart >= start - epsilon &&
+                    frameStart + frameSize <= start + size + epsilon) {
+                frame.css({
+                    left: (frameStart - start) / size * 100 + '%',
+                    width: frameSize / size * 100 + '%'
+                }).show();
+            } else if (frameDepth < depth && frameStart <= start + epsilon &&
+                    frameStart + frameSize >= start + size - epsilon) {
+                frame.css({left: 0, width: '100%'}).show();
+            } else {
+                frame.hide();
+            }
+        });
+    }
+    $('.djdt-flame-frame').on('click', function() {
+        var frame = $(this),
+            graph = frame.parent();
+        if (graph.data('zoomed') === this) {
+            graph.data('zoomed', null);
+            zoomFlameGraph(graph, 0, 100, 0);
+        } else {
+            graph.data('zoomed', this);
+            zoomFlameGraph(graph, frame.data('start'), frame.data('size'), frame.data('depth'));
+        }
+    });
     djdt.applyStyle('padding-left');
+    djdt.applyStyle('height');
+    djdt.applyStyle('top');
+    djdt.applyStyle('left');
+    djdt.applyStyle('width');
+    djdt.applyStyle('background-color');
 })(djdt.jQuery);
@@ -1,4 +1,7 @@
 (function ($) {
+    djdt.applyStyle('left');
+    djdt.applyStyle('width');
+
     // Browser timing remains hidden unless we can successfully access the performance object
     var perf = window.performance || window.msPerformance ||
                window.webkitPerformance || window.mozPerformance;
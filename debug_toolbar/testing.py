@@ -0,0 +1,71 @@
+"""
+Helpers to check the stats collected by the toolbar in tests.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client
+from django.test.utils import override_settings
+
+from debug_toolbar.budgets import (
+    BUDGET_METRICS, check_budget, get_budget, get_unknown_metrics,
+)
+
+
+class ToolbarClient(Client):
+    """
+    Test client that enables the toolbar for every request. Like Django's
+    test runner, it adds the ``testserver`` host it sends to
+    ``ALLOWED_HOSTS``, so that it can be used outside of tests.
+
+    Responses have a ``toolbar`` attribute, with the stats of every enabled
+    panel, even when the toolbar isn't inserted in the response. It's
+    ``None`` if the toolbar wasn't shown, for instance because
+    ``SHOW_TOOLBAR_CALLBACK`` rejected the request.
+    """
+
+    def request(self, **request):
+        remote_addr = request.get('REMOTE_ADDR', '127.0.0.1')
+        allowed_hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+        with override_settings(
+                DEBUG=True, INTERNAL_IPS=[remote_addr], ALLOWED_HOSTS=allowed_hosts):
+            response = super(ToolbarClient, self).request(**request)
+        response.toolbar = getattr(response.wsgi_request, 'toolbar', None)
+        if response.toolbar is not None:
+            response.toolbar.generate_stats(response)
+        return response
+
+
+class BudgetTestMixin(object):
+    """
+    Mixin for test cases that check requests against performance budgets.
+
+    It replaces the test client with :class:`ToolbarClient`.
+    """
+    client_class = ToolbarClient
+
+    def assertWithinBudget(self, response, budget=None):
+        """
+        Fail if the request that produced ``response`` exceeded ``budget``, a
+        dict like the values of the ``BUDGETS`` option. By default, use the
+        budget configured for the URL name of the request.
+        """
+        toolbar = response.toolbar
+        if toolbar is None:
+            self.fail("The toolbar wasn't shown for this request.")
+        if budget is None:
+            budget = get_budget(toolbar.request)
+            if budget is None:
+                self.fail("No budget is configured for this URL.")
+        unknown = get_unknown_metrics(budget)
+        if unknown:
+            raise ImproperlyConfigured(
+                "Unknown budget metrics: %s. Choose from: %s." % (
+                    ', '.join(unknown), ', '.join(BUDGET_METRICS)))
+        violations = check_budget(toolbar, budget)
+        if violations:
+            self.fail("Over budget for %s: %s" % (toolbar.request.path, ', '.join(
+                '%s %s > %s' % (violation['metric'], violation['value'], violation['limit'])
+                for violation in violations)))
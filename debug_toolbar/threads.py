@@ -0,0 +1,84 @@
+"""
+Carry the toolbar of the current request into worker threads.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import functools
+import threading
+from contextlib import contextmanager
+
+try:
+    from concurrent import futures
+except ImportError:  # Python 2 without the futures backport
+    futures = None
+
+
+def get_toolbar(thread=None):
+    """
+    Return the toolbar recording in ``thread`` (default: the current thread),
+    or ``None`` if the toolbar isn't active.
+    """
+    from debug_toolbar.middleware import DebugToolbarMiddleware
+    if thread is None:
+        thread = threading.current_thread()
+    return DebugToolbarMiddleware.debug_toolbars.get(thread.ident)
+
+
+@contextmanager
+def recording(toolbar, parent):
+    """
+    Record into ``toolbar`` what the current thread does, on behalf of the
+    ``parent`` thread that handles the request.
+    """
+    from debug_toolbar.middleware import DebugToolbarMiddleware
+    thread = threading.current_thread()
+    if thread is parent:
+        # Executors may run the callable in the calling thread.
+        yield
+        return
+
+    DebugToolbarMiddleware.debug_toolbars[thread.ident] = toolbar
+    for panel in toolbar.enabled_panels:
+        panel.enable_thread_instrumentation(parent)
+    try:
+        yield
+    finally:
+        for panel in reversed(toolbar.enabled_panels):
+            panel.disable_thread_instrumentation(parent)
+        DebugToolbarMiddleware.debug_toolbars.pop(thread.ident, None)
+
+
+def propagate(func):
+    """
+    Wrap ``func`` so that the toolbar of the current request records what it
+    does when it runs in another thread.
+
+    Call this in the thread handling the request, before handing ``func`` to
+    the worker thread. SQL queries and cache calls made by ``func`` show up
+    in the panels of the request, tagged with the name of the worker thread.
+    If the toolbar isn't active, ``func`` is returned unchanged.
+    """
+    parent = threading.current_thread()
+    toolbar = get_toolbar(parent)
+    if toolbar is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with recording(toolbar, parent):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+if futures is not None:
+
+    class ThreadPoolExecutor(futures.ThreadPoolExecutor):
+        """
+        Drop-in replacement for :class:`concurrent.futures.ThreadPoolExecutor`
+        that propagates the toolbar of the request submitting the tasks.
+        """
+
+        def submit(self, fn, *args, **kwargs):
+            return super(ThreadPoolExecutor, self).submit(
+                propagate(fn), *args, **kwargs)
@@ -15,6 +15,7 @@ from django.template import TemplateSyntaxError
 from django.template.loader import render_to_string
 
 from debug_toolbar import settings as dt_settings
+from debug_toolbar.budgets import check_budget, get_budget
 
 
 class DebugToolbar(object):
@@ -27,6 +28,8 @@ class DebugToolbar(object):
             panel_instance = panel_class(self)
             self._panels[panel_instance.panel_id] = panel_instance
         self.stats = {}
+        self.stats_generated = False
+        self.budget_violations = []
         self.store_id = None
 
     # Manage panels
@@ -51,6 +54,23 @@ class DebugToolbar(object):
         """
         return self._panels[panel_id]
 
+    def generate_stats(self, response):
+        """
+        Generate the stats of the enabled panels, unless it's already done.
+        """
+        if self.stats_generated:
+            return
+        self.stats_generated = True
+        for panel in reversed(self.enabled_panels):
+            panel.generate_stats(self.request, response)
+        budget = get_budget(self.request)
+        if budget:
+            self.budget_violations = check_budget(self, budget)
+
+    @property
+    def over_budget_panels(self):
+        return [violation['panel_id'] for violation in self.budget_violations]
+
     # Handle rendering the toolbar in HTML
 
     def render_toolbar(self):
@@ -4,6 +4,8 @@ import inspect
 import os.path
 import re
 import sys
+import time
+import weakref
 from importlib import import_module
 
 import django
@@ -23,8 +25,14 @@ except ImportError:
     threading = None
 
 
+# All panels take timestamps from the same high-resolution clock, so that
+# their events can be placed on a single timeline.
+timer = getattr(time, 'perf_counter', time.time)
+
+
 # Figure out some paths
 django_path = os.path.realpath(os.path.dirname(django.__file__))
+toolbar_path = os.path.dirname(os.path.abspath(__file__)) + os.sep
 
 
 def get_module_path(module_name):
@@ -87,7 +95,21 @@ def render_stacktrace(trace):
 
 
 def get_template_info():
-    template_info = None
+    template_node = get_template_node()
+    if template_node is None:
+        return None
+    return get_template_context(*template_node)
+
+
+def get_template_node():
+    """
+    Find the template node being rendered by walking up the stack.
+
+    Returns a ``(node, template)`` tuple, or ``None`` outside of template
+    rendering. Pass it to :func:`get_template_context` to extract the source
+    lines, which is much more expensive and can be deferred.
+    """
+    template_node = None
     cur_frame = sys._getframe().f_back
     try:
         while cur_frame is not None:
@@ -105,16 +127,32 @@ def get_template_info():
                 node = cur_frame.f_locals['self']
                 context = cur_frame.f_locals['context']
                 if isinstance(node, Node):
-                    template_info = get_template_context(node, context)
+                    template_node = (node, context.template)
                     break
             cur_frame = cur_frame.f_back
     except Exception:
         pass
     del cur_frame
-    return template_info
+    return template_node
+
+
+# Template nodes live as long as the template they belong to, which the
+# cached loader keeps around between requests.
+_template_context_cache = weakref.WeakKeyDictionary()
 
 
-def get_template_context(node, context, context_lines=3):
+def get_template_context(node, template, context_lines=3):
+    try:
+        cached = _template_context_cache.setdefault(node, {})
+    except TypeError:  # node doesn't support weak references
+        cached = {}
+    if context_lines not in cached:
+        cached[context_lines] = _get_template_context(
+            node, template, context_lines)
+    return cached[context_lines]
+
+
+def _get_template_context(node, template, context_lines):
     source = getattr(node, 'source', None)
     # In Django 1.9 template Node does not have source property, Origin does
     # not reload method, so we extract contextual information from exception
@@ -123,7 +161,7 @@ def get_template_context(node, context, context_lines=3):
         line, source_lines, name = get_template_source_from_source(source)
     else:
         line, source_lines, name = get_template_source_from_exception_info(
-            node, context)
+            node, template)
     debug_context = []
     start = max(1, line - context_lines)
     end = line + 1 + context_lines
@@ -142,28 +180,52 @@ def get_template_context(node, context, context_lines=3):
     }
 
 
+# Maps the name of a template origin to (mtime, line breaks, source lines).
+_template_source_cache = {}
+
+
+def get_template_source_lines(origin):
+    """
+    Return the offsets of the line breaks and the lines of the template
+    source. Reading the template is cached until the file is modified.
+    """
+    try:
+        mtime = os.path.getmtime(origin.name)
+    except (OSError, TypeError, ValueError):
+        mtime = None
+    cached = _template_source_cache.get(origin.name)
+    if mtime is not None and cached is not None and cached[0] == mtime:
+        return cached[1:]
+
+    template_source = origin.reload()
+    breaks = []
+    source_lines = []
+    upto = 0
+    for num, next in enumerate(linebreak_iter(template_source)):
+        breaks.append(next)
+        source_lines.append((num, template_source[upto:next]))
+        upto = next
+    if mtime is not None:
+        _template_source_cache[origin.name] = (mtime, breaks, source_lines)
+    return breaks, source_lines
+
+
 def get_template_source_from_source(source):
     line = 0
     upto = 0
-    source_lines = []
-    # before = during = after = ""
 
     origin, (start, end) = source
-    template_source = origin.reload()
+    breaks, source_lines = get_template_source_lines(origin)
 
-    for num, next in enumerate(linebreak_iter(template_source)):
+    for num, next in enumerate(breaks):
         if start >= upto and end <= next:
             line = num
-            # before = template_source[upto:start]
-            # during = template_source[start:end]
-            # after = template_source[end:next]
-        source_lines.append((num, template_source[upto:next]))
         upto = next
     return line, source_lines, origin.name
 
 
-def get_template_source_from_exception_info(node, context):
-    exception_info = context.template.get_exception_info(
+def get_template_source_from_exception_info(node, template):
+    exception_info = template.get_exception_info(
         Exception('DDT'), node.token)
     line = exception_info['line']
     source_lines = exception_info['source_lines']
@@ -258,6 +320,24 @@ def get_stack(context=1):
     return framelist
 
 
+def is_toolbar_file(file_name):
+    return file_name.startswith(toolbar_path)
+
+
+def get_call_site():
+    """
+    Return the file name and line number of the closest caller outside of
+    the toolbar, or ``None``. Unlike ``get_stack()``, it doesn't read the
+    source files, so it's cheap enough to call for every recorded call.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and is_toolbar_file(frame.f_code.co_filename):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return frame.f_code.co_filename, frame.f_lineno
+
+
 class ThreadCollector(object):
     def __init__(self):
         if threading is None:
@@ -285,3 +365,13 @@ class ThreadCollector(object):
 
     def collect(self, item, thread=None):
         self.get_collection(thread).append(item)
+
+    def merge_collection(self, parent, thread=None):
+        """
+        Moves the items collected for the provided thread, or the current
+        thread, to the collection of the parent thread.
+        """
+        items = self.get_collection(thread)
+        self.clear_collection(thread)
+        self.get_collection(parent).extend(items)
+        return items
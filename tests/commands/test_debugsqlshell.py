@@ -20,10 +20,17 @@ class DebugSQLShellTestCase(TestCase):
         # undo the monkey-patch on exit.
         command_name = 'debugsqlshell'
         app_name = management.get_commands()[command_name]
-        management.load_command_class(app_name, command_name)
+        command = management.load_command_class(app_name, command_name)
+        self.module = sys.modules[command.__module__]
+        # The module is only imported, and the wrapper installed, once.
+        db_backends_utils.CursorDebugWrapper = self.module.PrintQueryWrapper
+        self.module.query_stats.clear()
 
     def tearDown(self):
         db_backends_utils.CursorDebugWrapper = self.original_cursor_wrapper
+        self.module.PrintQueryWrapper.threshold = 0
+        self.module.PrintQueryWrapper.reformat = True
+        self.module.PrintQueryWrapper.explain = False
 
     def test_command(self):
         original_stdout, sys.stdout = sys.stdout, six.StringIO()
@@ -32,3 +39,46 @@ class DebugSQLShellTestCase(TestCase):
             self.assertIn("SELECT COUNT", sys.stdout.getvalue())
         finally:
             sys.stdout = original_stdout
+
+    def call_command(self, **options):
+        original_stdout, sys.stdout = sys.stdout, six.StringIO()
+        try:
+            management.call_command('debugsqlshell', **options)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = original_stdout
+
+    def test_threshold(self):
+        output = self.call_command(
+            command='from django.contrib.auth.models import User; User.objects.count()',
+            threshold=1000)
+        self.assertNotIn("SELECT COUNT", output)
+
+    def test_explain(self):
+        output = self.call_command(
+            command='from django.contrib.auth.models import User; User.objects.count()',
+            reformat=False, explain=True)
+        self.assertIn('SELECT COUNT(*) AS "__count" FROM "auth_user" [', output)
+        self.assertIn('SCAN', output)
+
+    def test_summary(self):
+        output = self.call_command(
+            command=(
+                'from django.contrib.auth.models import User\n'
+                'for pk in range(3): User.objects.filter(pk=pk).exists()'),
+            threshold=1000, summary=True)
+        self.assertNotIn('[', output)
+        self.assertIn('count   total ms     max ms  statement', output)
+        self.assertIn(
+            '     3 ', [line for line in output.splitlines() if 'SELECT (1)' in line][0])
+
+    def test_sqlstats(self):
+        output = self.call_command(
+            command=(
+                'from django.contrib.auth.models import User\n'
+                'User.objects.count()\n'
+                'sqlstats(reset=True)'),
+            threshold=1000)
+        self.assertIn('count   total ms     max ms  statement', output)
+        self.assertFalse(self.module.query_stats)
+        self.assertFalse(hasattr(six.moves.builtins, 'sqlstats'))
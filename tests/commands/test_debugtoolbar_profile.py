@@ -0,0 +1,63 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+from django.core import management
+from django.core.management import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import six
+
+
+class DebugToolbarProfileTestCase(TestCase):
+
+    def call_command(self, *args, **options):
+        stdout = six.StringIO()
+        management.call_command('debugtoolbar_profile', *args, stdout=stdout, **options)
+        return json.loads(stdout.getvalue())
+
+    def test_command(self):
+        result = self.call_command('/execute_sql/', repeat=2)
+        self.assertEqual(len(result['runs']), 2)
+        run = result['runs'][0]
+        self.assertEqual(run['status_code'], 200)
+        # Stats are generated although the toolbar isn't inserted.
+        self.assertEqual(run['sql']['count'], 1)
+        self.assertEqual(run['sql']['statements'][0]['count'], 1)
+        self.assertIn('FROM "auth_user"', run['sql']['statements'][0]['fingerprint'])
+        self.assertIn('total_time', run['time'])
+        self.assertEqual(result['summary']['sql_count'], {'min': 1, 'median': 1, 'max': 1})
+
+    @override_settings(ALLOWED_HOSTS=[])
+    def test_allowed_hosts(self):
+        # The host of the test client is allowed outside of tests too.
+        result = self.call_command('/execute_sql/')
+        self.assertEqual(result['runs'][0]['status_code'], 200)
+
+    def test_error(self):
+        with self.assertRaisesMessage(CommandError, 'returned the status code 404'):
+            self.call_command('/missing/')
+
+    def test_templates(self):
+        result = self.call_command('/regular/title/', data=['page=2'])
+        self.assertEqual(result['data'], {'page': ['2']})
+        self.assertEqual(result['runs'][0]['templates'], ['basic.html', 'base.html'])
+
+    @override_settings(DEBUG_TOOLBAR_PANELS=['debug_toolbar.panels.profiling.ProfilingPanel'])
+    def test_hotspots(self):
+        run = self.call_command('/execute_sql/')['runs'][0]
+        self.assertNotIn('sql', run)
+        self.assertTrue(run['hotspots'])
+        self.assertEqual(
+            sorted(run['hotspots'][0]), ['calls', 'cumulative_time', 'function', 'own_time'])
+
+    def test_output(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'stats.json')
+        management.call_command('debugtoolbar_profile', '/cached_view/', output=path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['runs'][0]['cache']['misses'], 1)
@@ -2,9 +2,23 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import threading
+import time
+
 from django.core import cache
+from django.middleware import cache as middleware_cache
+from django.middleware.cache import (
+    FetchFromCacheMiddleware, UpdateCacheMiddleware,
+)
+from django.test.utils import override_settings
+
+from debug_toolbar.middleware import DebugToolbarMiddleware
+from debug_toolbar.panels.cache import (
+    CacheHandlerPatch, CacheStatTracker, original_caches,
+)
+from debug_toolbar.toolbar import DebugToolbar
 
-from ..base import BaseTestCase
+from ..base import BaseTestCase, rf
 
 
 class CachePanelTestCase(BaseTestCase):
@@ -35,6 +49,113 @@ class CachePanelTestCase(BaseTestCase):
         second_cache.get('foo')
         self.assertEqual(len(self.panel.calls), 2)
 
+    def test_recording_per_request(self):
+        other_toolbar = DebugToolbar(self.request)
+        cache.cache.get('foo')
+        self.assertEqual(len(self.panel.calls), 1)
+        self.assertEqual(other_toolbar.get_panel_by_id('CachePanel').calls, [])
+
+        # Calls made outside of a request aren't recorded.
+        del DebugToolbarMiddleware.debug_toolbars[threading.current_thread().ident]
+        cache.cache.get('foo')
+        self.assertEqual(len(self.panel.calls), 1)
+
+    def test_instrumentation(self):
+        self.assertIsInstance(cache.caches, CacheHandlerPatch)
+        self.panel.disable_instrumentation()
+        self.assertIs(cache.caches, original_caches)
+        self.assertIs(middleware_cache.caches, original_caches)
+        # The middleware stays wrapped for the requests of other threads.
+        self.assertTrue(hasattr(FetchFromCacheMiddleware.process_request, 'original'))
+        self.assertTrue(hasattr(UpdateCacheMiddleware.process_response, 'original'))
+        middleware = FetchFromCacheMiddleware()
+        middleware.process_request(rf.get('/'))
+        self.assertEqual(len(self.panel.calls), 1)
+        # Without an active toolbar, the middleware uses its cache directly.
+        del DebugToolbarMiddleware.debug_toolbars[threading.current_thread().ident]
+        middleware.process_request(rf.get('/'))
+        self.assertEqual(len(self.panel.calls), 1)
+        self.assertNotIsInstance(middleware.cache, CacheStatTracker)
+
+    def test_key_stats(self):
+        self.toolbar.config['CACHE_SIZE_WARNING_THRESHOLD'] = 1000
+        cache.cache.set('user:1', 'x' * 2000)
+        cache.cache.get('user:1')
+        cache.cache.get_many(['user:2', 'user:1'])
+        cache.cache.get('settings')
+        cache.cache.get('settings')
+        self.panel.generate_stats(self.request, self.response)
+        stats = self.panel.get_stats()
+
+        keys = dict((key['key'], key) for key in stats['keys'])
+        self.assertEqual(keys['user:1']['calls'], 3)
+        self.assertEqual(keys['user:1']['hit_ratio'], 100)
+        self.assertTrue(keys['user:1']['read_after_set'])
+        self.assertTrue(keys['user:1']['is_large'])
+        self.assertEqual(keys['user:2']['hit_ratio'], 0)
+        self.assertFalse(keys['user:2']['memoize'])
+        self.assertEqual(keys['settings']['reads'], 2)
+        self.assertTrue(keys['settings']['memoize'])
+        self.assertFalse(keys['settings']['is_large'])
+
+        patterns = dict((pattern['pattern'], pattern) for pattern in stats['key_patterns'])
+        self.assertEqual(patterns['user:*']['keys'], 2)
+        self.assertEqual(patterns['user:*']['calls'], 4)
+        self.assertAlmostEqual(patterns['user:*']['hit_ratio'], 200 / 3.0)
+        self.assertEqual(len(stats['backends']), 1)
+
+        content = self.panel.content
+        self.assertIn('Read 2 times, keep the value in memory.', content)
+        self.assertIn('Large value.', content)
+
+    def test_values_not_kept(self):
+        value = ['x' * 100]
+        cache.cache.set('list', value)
+        cached = cache.cache.get('list')
+        # The size is measured when the call is recorded.
+        value.append('y' * 10000)
+        cached.append('y' * 10000)
+        self.panel.generate_stats(self.request, self.response)
+        stats = self.panel.get_stats()
+        self.assertLess(stats['keys'][0]['size'], 1000)
+        self.assertEqual(
+            [call['keys'][0]['hit'] for call in stats['calls']], [None, True])
+        self.assertFalse([call for call in stats['calls'] if 'return_value' in call])
+
+    def test_findings(self):
+        cache.cache.get('missing')
+        cache.cache.get('missing')
+        if cache.cache.get('computed') is None:
+            time.sleep(0.01)
+            cache.cache.set('computed', 1)
+        for i in range(3):
+            cache.cache.get('item:%d' % i)
+        self.panel.generate_stats(self.request, self.response)
+
+        findings = dict(
+            (finding['type'], finding) for finding in self.panel.get_stats()['findings'])
+        self.assertEqual(findings['repeated_miss']['keys'], ['missing'])
+        self.assertEqual(findings['repeated_miss']['count'], 2)
+        self.assertEqual(findings['recompute']['keys'], ['computed'])
+        self.assertGreaterEqual(findings['recompute']['time'], 10)
+        self.assertEqual(len(findings['recompute']['traces']), 2)
+        self.assertEqual(findings['get_loop']['keys'], ['item:0', 'item:1', 'item:2'])
+        self.assertIn('use get_many', self.panel.content)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={'ENABLE_STACKTRACES': False})
+    def test_findings_without_stacktraces(self):
+        cache.cache.get('a')
+        cache.cache.get('b')
+        cache.cache.get('c')
+        for i in range(3):
+            cache.cache.get('item:%d' % i)
+        self.panel.generate_stats(self.request, self.response)
+
+        findings = self.panel.get_stats()['findings']
+        self.assertEqual(
+            [finding['keys'] for finding in findings if finding['type'] == 'get_loop'],
+            [['item:0', 'item:1', 'item:2']])
+
     def test_insert_content(self):
         """
         Test that the panel only inserts content after generate_stats and
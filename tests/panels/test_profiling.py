@@ -1,11 +1,19 @@
 from __future__ import absolute_import, unicode_literals
 
+import json
+import time
+
 from django.contrib.auth.models import User
 from django.db import IntegrityError, transaction
 from django.test import TestCase
 from django.test.utils import override_settings
 
-from ..base import BaseTestCase
+from debug_toolbar.panels.profiling import (
+    REQUEST_FUNC, get_flame_graph, is_toolbar_file, profiling_export,
+)
+from debug_toolbar.testing import ToolbarClient
+
+from ..base import BaseTestCase, rf
 from ..views import regular_view
 
 
@@ -23,6 +31,72 @@ class ProfilingPanelTestCase(BaseTestCase):
         self.assertIn('func_list', self.panel.get_stats())
         self.assertIn('regular_view', self.panel.content)
 
+    def test_sampling(self):
+        self.toolbar.config['PROFILER_SAMPLING'] = True
+
+        def busy_view(request):
+            end = time.time() + 0.05
+            while time.time() < end:
+                pass
+            return regular_view(request, 'sampling')
+
+        self.panel.process_view(self.request, busy_view, (), {})
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        stats = self.panel.get_stats()
+        self.assertTrue(stats['sampling'])
+        self.assertGreater(stats['sample_count'], 0)
+        root = stats['func_list'][0]
+        self.assertEqual(root.func[2], 'busy_view')
+        self.assertEqual(root.samples, stats['sample_count'])
+        self.assertAlmostEqual(root.time, stats['total_time'])
+        self.assertIn('busy_view', self.panel.content)
+
+    def test_flame_graph(self):
+        view = ('views.py', 1, 'view')
+        render = ('template.py', 10, 'render')
+        query = ('db.py', 20, 'execute')
+        frames = get_flame_graph([
+            ((view,), 1), ((view, render), 2), ((view, render, query), 1)], 1000)
+        self.assertEqual(
+            [(frame['label'], frame['depth'], frame['left'], frame['width'])
+             for frame in frames],
+            [('view (views.py:1)', 0, 0, 100),
+             ('render (template.py:10)', 1, 0, 75),
+             ('execute (db.py:20)', 2, 0, 25)])
+        self.assertEqual(frames[1]['time'], 3000)
+        self.assertEqual(get_flame_graph([], 1000), [])
+
+    def test_export(self):
+        self.panel.process_view(self.request, regular_view, ('profiling',), {})
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        stacks = self.panel.get_stats()['stacks']
+        self.assertTrue(all(stack[0][2] == 'regular_view' for stack, value in stacks))
+        self.assertIn('Flame graph', self.panel.content)
+        self.toolbar.store()
+
+        # The URLs of the toolbar only include the default panels in tests.
+        url = '/__debug__/profiling_export/'
+        response = profiling_export(rf.get(url, {
+            'store_id': self.toolbar.store_id, 'format': 'folded'}))
+        self.assertEqual(response.status_code, 200)
+        for line in response.content.decode('utf-8').splitlines():
+            self.assertRegexpMatches(line, r'^regular_view \(views\.py:\d+\)(;[^;]+)* \d+$')
+
+        response = profiling_export(rf.get(url, {
+            'store_id': self.toolbar.store_id, 'format': 'speedscope'}))
+        self.assertEqual(response.status_code, 200)
+        profile = json.loads(response.content.decode('utf-8'))['profiles'][0]
+        self.assertEqual(profile['unit'], 'microseconds')
+        self.assertEqual(len(profile['samples']), len(profile['weights']))
+        self.assertEqual(profile['endValue'], sum(profile['weights']))
+
+        response = profiling_export(rf.get(url, {'store_id': self.toolbar.store_id}))
+        self.assertEqual(response.status_code, 400)
+        response = profiling_export(rf.get(url, {'store_id': 'unknown', 'format': 'folded'}))
+        self.assertEqual(response.status_code, 400)
+
     def test_insert_content(self):
         """
         Test that the panel only inserts content after generate_stats and
@@ -52,3 +126,43 @@ class ProfilingPanelIntegrationTestCase(TestCase):
             with transaction.atomic():
                 response = self.client.get('/new_user/')
         self.assertEqual(User.objects.count(), 1)
+
+
+@override_settings(
+    DEBUG_TOOLBAR_PANELS=[
+        'debug_toolbar.panels.templates.TemplatesPanel',
+        'debug_toolbar.panels.profiling.ProfilingPanel',
+    ],
+    DEBUG_TOOLBAR_CONFIG={'PROFILER_WHOLE_REQUEST': True},
+)
+class ProfilingPanelWholeRequestTestCase(TestCase):
+    client_class = ToolbarClient
+
+    def setUp(self):
+        self.client.cookies[str('djdtProfilingPanel')] = 'on'
+
+    def get_funcs(self, response):
+        stats = response.toolbar.get_panel_by_id('ProfilingPanel').get_stats()
+        return stats, set(func for stack, value in stats['stacks'] for func in stack)
+
+    def test_whole_request(self):
+        response = self.client.get('/template_response/whole/')
+        stats, funcs = self.get_funcs(response)
+        self.assertEqual(stats['func_list'][0].func, REQUEST_FUNC)
+        names = set(func[2] for func in funcs)
+        self.assertIn('template_response_view', names)
+        # The response is rendered after the view returns.
+        self.assertIn('render', names)
+        self.assertFalse([func for func in funcs if is_toolbar_file(func[0])])
+        self.assertFalse([
+            call for call in stats['func_list'] if is_toolbar_file(call.func[0])])
+
+    def test_whole_request_sampling(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={
+                'PROFILER_WHOLE_REQUEST': True, 'PROFILER_SAMPLING': True}):
+            response = self.client.get('/busy/')
+        stats, funcs = self.get_funcs(response)
+        self.assertTrue(stats['sampling'])
+        self.assertGreater(stats['sample_count'], 0)
+        self.assertIn('busy_view', set(func[2] for func in funcs))
+        self.assertFalse([func for func in funcs if is_toolbar_file(func[0])])
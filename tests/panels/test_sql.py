@@ -2,15 +2,28 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import json
 import unittest
 
-from django.contrib.auth.models import User
-from django.db import connection
+from django.contrib.auth.models import Group, User
+from django.db import connection, transaction
 from django.db.utils import DatabaseError
+from django.http import HttpResponse
 from django.shortcuts import render
-from django.test.utils import override_settings
+from django.template.loader import render_to_string
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from ..base import BaseTestCase
+from debug_toolbar.panels.sql import tracking, utils, views
+from debug_toolbar.panels.sql.forms import signer
+from debug_toolbar.panels.sql.indexes import get_column_roles
+from debug_toolbar.panels.sql.utils import (
+    explain_query, find_full_scans, fingerprint_sql, get_plan_tree,
+    summarize_durations,
+)
+from debug_toolbar.toolbar import DebugToolbar
+
+from ..base import BaseTestCase, rf
 
 
 class SQLPanelTestCase(BaseTestCase):
@@ -41,13 +54,253 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
         self.assertEqual(query[0], 'default')
-        self.assertTrue('sql' in query[1])
+        self.assertTrue('raw_sql' in query[1])
         self.assertTrue('duration' in query[1])
         self.assertTrue('stacktrace' in query[1])
 
         # ensure the stacktrace is populated
         self.assertTrue(len(query[1]['stacktrace']) > 0)
 
+    def test_params_copied(self):
+        params = ['foo']
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s', params)
+            # Callers may reuse their list of parameters.
+            params[0] = 'bar'
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        self.assertEqual(self.panel._queries[0][1]['params'], '["foo"]')
+
+    def test_generate_stats(self):
+        list(User.objects.filter(username='foo'))
+
+        # the interpolated SQL is only derived when the stats are generated
+        query = self.panel._queries[0][1]
+        self.assertNotIn('sql', query)
+        self.assertNotIn('params', query)
+
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+
+        self.assertIn('foo', query['sql'])
+        self.assertEqual(query['vendor'], connection.vendor)
+        self.assertEqual(query['params'], '["foo"]')
+        self.assertTrue(query['is_select'])
+        self.assertFalse(query['is_slow'])
+
+        # formatting is deferred until the panel is rendered
+        self.assertNotIn('formatted_sql', query)
+        self.assertIn('<strong>SELECT</strong>', self.panel.content)
+        self.assertIn('<strong>SELECT</strong>', query['formatted_sql'])
+
+    def test_formatting_cache(self):
+        for i in range(5):
+            list(User.objects.filter(username='user%d' % i, id=i))
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        utils._format_sql_cached.cache_clear()
+
+        content = self.panel.content
+        # Queries that only differ by their parameters are formatted once.
+        self.assertEqual(utils._format_sql_cached.cache_info().misses, 1)
+        self.assertEqual(utils._format_sql_cached.cache_info().hits, 4)
+        queries = self.panel.get_stats()['queries']
+        for i, query in enumerate(queries):
+            self.assertEqual(query['formatted_sql'], utils._format_sql(query['sql']))
+            self.assertIn('&#39;user%d&#39;' % i, content)
+
+        sql = "SELECT name FROM t WHERE name LIKE 'a%' AND id = 1"
+        for raw_sql in ("SELECT name FROM t WHERE name LIKE 'a%%' AND id = %s",
+                        "SELECT name FROM t WHERE name LIKE 'a%%' AND id = %(id)s"):
+            self.assertEqual(utils.reformat_sql(sql, raw_sql), utils._format_sql(sql))
+
+    def test_cursor_attributes(self):
+        cursor = connection.cursor()
+        self.assertIsInstance(cursor, tracking.NormalCursorWrapper)
+        cursor.execute('SELECT 1 AS one, 2 AS two')
+        self.assertEqual([column[0] for column in cursor.description], ['one', 'two'])
+        self.assertEqual(cursor.rowcount, cursor.cursor.rowcount)
+        self.assertEqual(cursor.lastrowid, cursor.cursor.lastrowid)
+        cursor.close()
+        with self.assertRaises(DatabaseError):
+            cursor.execute('SELECT 1')
+
+    def test_executemany(self):
+        sql = 'INSERT INTO auth_group (name) VALUES (%s)'
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [('group%d' % i,) for i in range(100)])
+            # iterators can only be consumed once
+            cursor.executemany(sql, (('other%d' % i,) for i in range(10)))
+
+        self.assertEqual(len(self.panel._queries), 2)
+        self.assertEqual(Group.objects.count(), 110)
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+
+        query = self.panel._queries[0][1]
+        self.assertEqual(query['batch_rows'], 100)
+        self.assertEqual(query['params'], '["group0"]')
+        self.assertEqual(len(query['batch_params']), 5)
+        self.assertEqual(self.panel._queries[1][1]['batch_rows'], 10)
+        self.assertIn('Batch of 100 rows', self.panel.content)
+
+    def test_executemany_live_cursor_vendor(self):
+        sql = 'INSERT INTO auth_group (name) VALUES (%s)'
+        live_cursor_vendors = tracking.LIVE_CURSOR_VENDORS
+        tracking.LIVE_CURSOR_VENDORS = (connection.vendor,)
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [('group%d' % i,) for i in range(100)])
+        finally:
+            tracking.LIVE_CURSOR_VENDORS = live_cursor_vendors
+
+        # The SQL of a batch isn't read from the cursor.
+        query = self.panel._queries[0][1]
+        self.assertNotIn('sql', query)
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        self.assertIn('group0', query['sql'])
+        self.assertNotIn('group1', query['sql'])
+
+    def test_fetched_rows(self):
+        Group.objects.bulk_create(Group(name='group%d' % i) for i in range(20))
+        list(Group.objects.all())
+        Group.objects.first()
+
+        with self.settings(DEBUG_TOOLBAR_CONFIG={'SQL_ROWS_WARNING_THRESHOLD': 10}):
+            self.panel.process_response(self.request, self.response)
+            self.panel.generate_stats(self.request, self.response)
+
+        insert, select_all, select_first = (q for a, q in self.panel._queries)
+        self.assertEqual(insert['rows'], 0)
+        self.assertEqual(select_all['rows'], 20)
+        self.assertGreater(select_all['fetch_bytes'], 20 * len('group0'))
+        self.assertTrue(select_all['is_many_rows'])
+        self.assertEqual(select_first['rows'], 1)
+        self.assertFalse(select_first['is_many_rows'])
+        self.assertIn('Rows fetched:', self.panel.content)
+
+    def test_explain_all(self):
+        list(User.objects.filter(first_name__in=['Ada', 'Grace']))
+        list(User.objects.filter(first_name__in=['Barbara']))
+        list(User.objects.filter(first_name__in=['Frances', 'Margaret', 'Radia']))
+        User.objects.filter(pk=1).first()
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        self.panel.disable_instrumentation()
+        self.toolbar.store()
+
+        response = self.client.post('/__debug__/sql_explain_all/', {
+            'store_id': signer.sign(self.toolbar.store_id),
+        })
+        self.assertEqual(response.status_code, 200)
+        by_first_name, by_pk = response.context['statements']
+        self.assertEqual(by_first_name['count'], 3)
+        self.assertTrue(by_first_name['full_scans'])
+        self.assertEqual(by_pk['count'], 1)
+        self.assertEqual(by_pk['full_scans'], [])
+        self.assertContains(response, 'Full table scans', count=1)
+
+        # Plans are cached by alias and fingerprint.
+        key = ('default', fingerprint_sql(self.panel._queries[0][1]['raw_sql']))
+        self.assertIs(views._plans[key]['result'], by_first_name['result'])
+
+    def test_duration_summary(self):
+        summary = summarize_durations([900] + [1] * 899 + [0.05, 5, 50, 2000])
+        self.assertEqual(summary['percentiles'], [(50, 1), (90, 1), (99, 1)])
+        self.assertEqual(summary['max'], 2000)
+        self.assertEqual(
+            [(bucket['high'], bucket['count']) for bucket in summary['buckets']],
+            [(0.1, 1), (1, 0), (10, 900), (100, 1), (1000, 1), (None, 1)])
+        self.assertEqual(summary['buckets'][2]['width_ratio'], 100)
+        self.assertIsNone(summarize_durations([]))
+
+        list(User.objects.all())
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+        self.assertEqual(self.panel.get_stats()['summary']['buckets'][-1]['count'], 0)
+        self.assertEqual(self.panel.get_stats()['databases'][0][1]['time_share'], 100)
+        self.assertIn('Query durations', self.panel.content)
+
+    def test_index_candidates(self):
+        list(User.objects.filter(email='ada@example.com'))
+        list(User.objects.filter(first_name='Ada', username='ada').order_by('last_name'))
+        list(User.objects.filter(groups__name='admins'))
+        # Only slow queries are considered.
+        for alias, query in self.panel._queries[1:]:
+            query['duration'] = 1000
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+
+        self.assertEqual(
+            get_column_roles(self.panel._queries[2][1]['raw_sql']),
+            (('auth_user', 'id', 'ON'),
+             ('auth_user_groups', 'user_id', 'ON'),
+             ('auth_user_groups', 'group_id', 'ON'),
+             ('auth_group', 'id', 'ON'),
+             ('auth_group', 'name', 'WHERE')))
+
+        content = self.panel.content
+        self.assertIn('Index candidates', content)
+        self.assertIn('<code>first_name</code>', content)
+        self.assertIn('<code>last_name</code>', content)
+        # Unique and foreign key columns are indexed.
+        self.assertNotIn('<code>username</code>', content)
+        self.assertNotIn('<code>group_id</code>', content)
+        self.assertNotIn('<code>name</code>', content)
+        # Fast queries are ignored.
+        self.assertNotIn('<code>email</code>', content)
+
+    def test_sql_select_pages(self):
+        Group.objects.bulk_create(Group(name='group%d' % i) for i in range(5))
+        list(Group.objects.order_by('name'))
+        self.panel.generate_stats(self.request, self.response)
+        self.panel.disable_instrumentation()
+        self.toolbar.store()
+        data = {
+            'store_id': signer.sign(self.toolbar.store_id),
+            'query': len(self.panel._queries) - 1,
+        }
+
+        with self.settings(DEBUG_TOOLBAR_CONFIG={'SQL_SELECT_PAGE_SIZE': 2}):
+            response = self.client.post('/__debug__/sql_select/', data)
+            self.assertEqual(
+                [row[1] for row in response.context['result']], ['group0', 'group1'])
+            self.assertFalse(response.context['previous_page'])
+            self.assertEqual(response.context['next_page'], 2)
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post('/__debug__/sql_select/', dict(data, page=3))
+            self.assertEqual([row[1] for row in response.context['result']], ['group4'])
+            if connection.vendor != 'postgresql':
+                # Rows of other pages aren't fetched.
+                self.assertTrue([query for query in context.captured_queries
+                                 if query['sql'].endswith('LIMIT 3 OFFSET 4')])
+            self.assertEqual(response.context['first_row'], 5)
+            self.assertEqual(response.context['previous_page'], 2)
+            self.assertIsNone(response.context['next_page'])
+
+    def test_sql_views_query_reference(self):
+        list(User.objects.filter(username='ada'))
+        self.panel.generate_stats(self.request, self.response)
+        self.panel.disable_instrumentation()
+
+        # Without a stored toolbar, each query comes with a signed form.
+        self.assertIn('name="hash"', self.panel.content)
+        self.toolbar.store()
+        content = self.panel.content
+        self.assertNotIn('name="hash"', content)
+        self.assertIn(signer.sign(self.toolbar.store_id), content)
+
+        data = {'store_id': signer.sign(self.toolbar.store_id), 'query': 0}
+        response = self.client.post('/__debug__/sql_explain/', data)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/__debug__/sql_explain/', dict(data, query=1))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/__debug__/sql_explain/', dict(data, store_id=self.toolbar.store_id))
+        self.assertEqual(response.status_code, 400)
+
     def test_non_ascii_query(self):
         self.assertEqual(len(self.panel._queries), 0)
 
@@ -103,7 +356,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
         self.assertEqual(query[0], 'default')
-        self.assertTrue('sql' in query[1])
+        self.assertTrue('raw_sql' in query[1])
         self.assertTrue('duration' in query[1])
         self.assertTrue('stacktrace' in query[1])
 
@@ -128,9 +381,128 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 2)
         query = self.panel._queries[0]
         self.assertEqual(query[0], 'default')
-        self.assertTrue('sql' in query[1])
+        self.assertTrue('raw_sql' in query[1])
         self.assertTrue('duration' in query[1])
         self.assertTrue('stacktrace' in query[1])
 
         # ensure the stacktrace is populated
         self.assertTrue(len(query[1]['stacktrace']) > 0)
+
+
+class SQLPanelTransactionTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.request = rf.get('/')
+        self.response = HttpResponse()
+        self.toolbar = DebugToolbar(self.request)
+        self.panel = self.toolbar.get_panel_by_id('SQLPanel')
+        self.panel.enable_instrumentation()
+
+    def tearDown(self):
+        self.panel.disable_instrumentation()
+
+    def test_transactions(self):
+        with transaction.atomic():
+            Group.objects.create(name='outer')
+            try:
+                with transaction.atomic():
+                    Group.objects.create(name='inner')
+                    raise ValueError
+            except ValueError:
+                pass
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Group.objects.create(name='rolled back')
+                raise ValueError
+        list(Group.objects.all())
+
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+
+        (alias, events), = self.panel.get_stats()['timeline']
+        self.assertEqual(alias, 'default')
+        self.assertEqual(
+            [(event['type'], event['outcome']) for event in events],
+            [('transaction', 'commit'), ('savepoint', 'rollback'),
+             ('transaction', 'rollback')])
+
+        # queries are grouped by transaction regardless of the vendor
+        inserts = [query for alias, query in self.panel._queries
+                   if query['raw_sql'].startswith('INSERT')]
+        self.assertTrue(all(query.get('in_trans') for query in inserts))
+        self.assertEqual(len(set(query['trans_id'] for query in inserts)), 2)
+        self.assertNotIn('in_trans', self.panel._queries[-1][1])
+        self.assertIn('Transaction rolled back', self.panel.content)
+
+
+POSTGRESQL_PLAN = json.dumps([{
+    'Plan': {
+        'Node Type': 'Nested Loop',
+        'Plan Rows': 5, 'Actual Rows': 200, 'Actual Loops': 1,
+        'Actual Total Time': 7.5,
+        'Shared Hit Blocks': 12, 'Shared Read Blocks': 3,
+        'Plans': [{
+            'Node Type': 'Seq Scan',
+            'Relation Name': 'auth_user',
+            'Filter': "(first_name = 'Ada'::text)",
+            'Plan Rows': 1, 'Actual Rows': 100, 'Actual Loops': 1,
+            'Actual Total Time': 6.0,
+            'Shared Hit Blocks': 2, 'Shared Read Blocks': 3,
+        }, {
+            'Node Type': 'Index Scan',
+            'Relation Name': 'auth_user_groups',
+            'Index Name': 'auth_user_groups_user_id',
+            'Index Cond': '(user_id = auth_user.id)',
+            'Plan Rows': 2, 'Actual Rows': 2, 'Actual Loops': 100,
+            'Actual Total Time': 0.01,
+            'Shared Hit Blocks': 10,
+        }],
+    },
+    'Execution Time': 7.6,
+}])
+
+
+class PostgreSQLPlanTestCase(TestCase):
+
+    def test_plan_tree(self):
+        plan = get_plan_tree('postgresql', [(POSTGRESQL_PLAN,)])
+        seq_scan, index_scan = plan['children']
+
+        self.assertEqual(plan['type'], 'Nested Loop')
+        self.assertAlmostEqual(plan['self_time'], 0.5)
+        self.assertFalse(plan['is_expensive'])
+        self.assertTrue(plan['is_misestimated'])
+
+        self.assertEqual(seq_scan['actual_rows'], 100)
+        self.assertEqual(seq_scan['misestimate'], 100)
+        self.assertTrue(seq_scan['is_expensive'])
+        self.assertEqual(seq_scan['shared_read'], 3)
+        self.assertEqual(seq_scan['conditions'], [('Filter', "(first_name = 'Ada'::text)")])
+
+        # Times and rows are per loop
+        self.assertEqual(index_scan['actual_rows'], 200)
+        self.assertAlmostEqual(index_scan['time'], 1.0)
+        self.assertFalse(index_scan['is_expensive'])
+        self.assertFalse(index_scan['is_misestimated'])
+
+        self.assertEqual(
+            find_full_scans('postgresql', ['QUERY PLAN'], [(POSTGRESQL_PLAN,)]),
+            ['Seq Scan on auth_user'])
+        self.assertIsNone(get_plan_tree('sqlite', [(0, 0, 0, 'SCAN TABLE auth_user')]))
+
+    def test_render_plan_tree(self):
+        plan = get_plan_tree('postgresql', [(POSTGRESQL_PLAN,)])
+        content = render_to_string('debug_toolbar/panels/sql_explain_node.html', {'node': plan})
+        self.assertEqual(content.count('<details'), 3)
+        self.assertEqual(content.count('djdt-plan-expensive'), 1)
+        self.assertIn('auth_user_groups_user_id', content)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql',
+                         'Test valid only on PostgreSQL')
+    def test_explain(self):
+        with connection.cursor() as cursor:
+            headers, result = explain_query(
+                connection, cursor, 'SELECT * FROM auth_user WHERE first_name = %s', ['Ada'])
+        plan = get_plan_tree(connection.vendor, result)
+        self.assertEqual(plan['relation'], 'auth_user')
+        self.assertIn('shared_hit', plan)
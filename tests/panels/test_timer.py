@@ -0,0 +1,79 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core import cache
+from django.core.signals import request_started
+
+from debug_toolbar.middleware import DebugToolbarMiddleware
+
+from ..base import BaseTestCase
+
+
+class TimerPanelTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TimerPanelTestCase, self).setUp()
+        self.panel = self.toolbar.get_panel_by_id('TimerPanel')
+        self.sql_panel = self.toolbar.get_panel_by_id('SQLPanel')
+        self.cache_panel = self.toolbar.get_panel_by_id('CachePanel')
+        self.sql_panel.enable_instrumentation()
+        self.cache_panel.enable_instrumentation()
+
+    def tearDown(self):
+        self.cache_panel.disable_instrumentation()
+        self.sql_panel.disable_instrumentation()
+        super(TimerPanelTestCase, self).tearDown()
+
+    def test_timeline(self):
+        self.panel.process_request(self.request)
+        self.panel.process_view(self.request, None, (), {})
+        list(User.objects.all())
+        time.sleep(0.01)
+        cache.cache.get('party')
+        self.panel.process_response(self.request, self.response)
+        self.panel.generate_stats(self.request, self.response)
+
+        timeline = self.panel.get_timeline()
+        events = timeline['events']
+        self.assertEqual(
+            [str(event['label']) for event in events if str(event['category']) == 'Phase'],
+            ['Request', 'View', 'Response'])
+        self.assertEqual(
+            [str(event['category']) for event in events if event.get('io')],
+            ['SQL', 'Cache'])
+        # Events are sorted by start time on the same clock.
+        offsets = [event['offset'] for event in events]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(events[0]['offset'], 0)
+
+        # The sleep between the query and the cache call is a gap.
+        gaps = [event for event in events if event.get('is_gap')]
+        self.assertTrue(any(gap['duration'] >= 10 for gap in gaps))
+        self.assertGreaterEqual(timeline['unaccounted_time'], 10)
+        self.assertLess(timeline['unaccounted_time'], timeline['total_time'])
+
+        self.assertIn('Request timeline', self.panel.content)
+
+    def test_signal_events(self):
+        signals_panel = self.toolbar.get_panel_by_id('SignalsPanel')
+        signals_panel.enable_instrumentation()
+        # Another request finishing doesn't stop the timing of this one.
+        signals_panel.disable_instrumentation()
+
+        def receiver(sender, **kwargs):
+            pass
+        request_started.connect(receiver)
+        try:
+            request_started.send(sender=self.__class__)
+            self.assertEqual(len(signals_panel.sends), 1)
+            del DebugToolbarMiddleware.debug_toolbars[threading.current_thread().ident]
+            request_started.send(sender=self.__class__)
+            self.assertEqual(len(signals_panel.sends), 1)
+        finally:
+            request_started.disconnect(receiver)
+        self.assertEqual(
+            [event['label'] for event in signals_panel.get_timeline_events()],
+            ['request_started (TimerPanelTestCase)'])
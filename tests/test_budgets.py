@@ -0,0 +1,62 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.checks import run_checks
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from debug_toolbar.testing import BudgetTestMixin
+
+
+@override_settings(DEBUG_TOOLBAR_CONFIG={
+    'RENDER_PANELS': False,
+    'BUDGETS': {
+        'execute_sql': {'sql_queries': 0, 'cache_calls': 5},
+        'regular': {'templates': 1, 'total_time': 60000},
+    },
+})
+class BudgetsTestCase(BudgetTestMixin, TestCase):
+
+    def test_within_budget(self):
+        response = self.client.get('/execute_sql/')
+        self.assertWithinBudget(response, {'sql_queries': 1, 'sql_time': 60000})
+        self.assertEqual(response.toolbar.budget_violations[0]['metric'], 'sql_queries')
+
+    def test_over_budget(self):
+        response = self.client.get('/execute_sql/')
+        with self.assertRaisesMessage(
+                AssertionError, 'Over budget for /execute_sql/: sql_queries 1 > 0'):
+            self.assertWithinBudget(response)
+
+    def test_no_budget(self):
+        response = self.client.get('/resolving3/a/')
+        with self.assertRaisesMessage(AssertionError, 'No budget is configured'):
+            self.assertWithinBudget(response)
+
+    def test_unknown_metric(self):
+        response = self.client.get('/execute_sql/')
+        with self.assertRaises(ImproperlyConfigured):
+            self.assertWithinBudget(response, {'queries': 1})
+
+    def test_check(self):
+        self.assertEqual(run_checks(tags=None), [])
+        budgets = {'execute_sql': {'queries': 1, 'sql_time': '10'}, 'regular': 5}
+        with self.settings(DEBUG_TOOLBAR_CONFIG={'BUDGETS': budgets}):
+            messages = [message.msg for message in run_checks()]
+            # A typo doesn't break the requests.
+            response = self.client.get('/execute_sql/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(messages, [
+            "The budget of 'execute_sql' in DEBUG_TOOLBAR_CONFIG['BUDGETS'] has "
+            "unknown metrics: queries.",
+            "The sql_time limit of 'execute_sql' in DEBUG_TOOLBAR_CONFIG['BUDGETS'] "
+            "isn't a number.",
+            "The budget of 'regular' in DEBUG_TOOLBAR_CONFIG['BUDGETS'] isn't a dict.",
+        ])
+
+    def test_toolbar(self):
+        # basic.html extends base.html.
+        response = self.client.get('/regular/title/')
+        self.assertContains(response, 'Over budget')
+        self.assertContains(response, 'Templates rendered: 2 &gt; 1')
+        self.assertContains(response, 'djDebugPanelButton djdt-over-budget', count=1)
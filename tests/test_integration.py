@@ -91,12 +91,14 @@ class DebugToolbarTestCase(BaseTestCase):
         self.assertContains(resp, '</div>\n</body>')
 
     def test_cache_page(self):
-        self.client.get('/cached_view/')
+        response = self.client.get('/cached_view/')
         self.assertEqual(
-            len(self.toolbar.get_panel_by_id('CachePanel').calls), 3)
-        self.client.get('/cached_view/')
+            len(response.wsgi_request.toolbar.get_panel_by_id('CachePanel').calls), 3)
+        response = self.client.get('/cached_view/')
         self.assertEqual(
-            len(self.toolbar.get_panel_by_id('CachePanel').calls), 5)
+            len(response.wsgi_request.toolbar.get_panel_by_id('CachePanel').calls), 2)
+        # Calls are only recorded by the toolbar of the request.
+        self.assertEqual(self.toolbar.get_panel_by_id('CachePanel').calls, [])
 
 
 @override_settings(DEBUG=True)
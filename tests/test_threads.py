@@ -0,0 +1,85 @@
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+import unittest
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+
+from debug_toolbar.middleware import DebugToolbarMiddleware
+from debug_toolbar.threads import futures, get_toolbar, propagate
+
+from .base import BaseTestCase
+
+if futures is not None:
+    from debug_toolbar.threads import ThreadPoolExecutor
+
+
+def work():
+    try:
+        User.objects.count()
+        cache.get('party')
+        logging.getLogger('tests').warning('from a worker')
+    finally:
+        connection.close()
+    return threading.current_thread().name
+
+
+class ThreadsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ThreadsTestCase, self).setUp()
+        self.sql_panel = self.toolbar.get_panel_by_id('SQLPanel')
+        self.cache_panel = self.toolbar.get_panel_by_id('CachePanel')
+        self.logging_panel = self.toolbar.get_panel_by_id('LoggingPanel')
+        for panel in (self.sql_panel, self.cache_panel, self.logging_panel):
+            panel.enable_instrumentation()
+            panel.process_request(self.request)
+
+    def tearDown(self):
+        for panel in (self.sql_panel, self.cache_panel, self.logging_panel):
+            panel.disable_instrumentation()
+        super(ThreadsTestCase, self).tearDown()
+
+    def assertRecordedIn(self, thread_name):
+        self.assertEqual(len(self.sql_panel._queries), 1)
+        alias, query = self.sql_panel._queries[0]
+        self.assertEqual(query['thread'], thread_name)
+
+        self.assertEqual(len(self.cache_panel.calls), 1)
+        self.assertEqual(self.cache_panel.calls[0]['thread'], thread_name)
+
+        self.logging_panel.generate_stats(self.request, self.response)
+        records = self.logging_panel.get_stats()['records']
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['thread'], thread_name)
+
+    def test_get_toolbar(self):
+        self.assertIs(get_toolbar(), self.toolbar)
+        del DebugToolbarMiddleware.debug_toolbars[threading.current_thread().ident]
+        self.assertIsNone(get_toolbar())
+
+    def test_propagate(self):
+        thread = threading.Thread(target=propagate(work), name='worker')
+        thread.start()
+        thread.join()
+        self.assertRecordedIn('worker')
+        self.assertNotIn(thread.ident, DebugToolbarMiddleware.debug_toolbars)
+
+    def test_propagate_in_same_thread(self):
+        propagate(work)()
+        alias, query = self.sql_panel._queries[0]
+        self.assertNotIn('thread', query)
+        self.assertIn(threading.current_thread().ident, DebugToolbarMiddleware.debug_toolbars)
+
+    def test_propagate_without_toolbar(self):
+        del DebugToolbarMiddleware.debug_toolbars[threading.current_thread().ident]
+        self.assertIs(propagate(work), work)
+
+    @unittest.skipIf(futures is None, "concurrent.futures isn't available")
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            thread_name = executor.submit(work).result()
+        self.assertRecordedIn(thread_name)
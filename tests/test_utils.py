@@ -1,8 +1,14 @@
 from __future__ import absolute_import, unicode_literals
 
+import os
+import tempfile
 import unittest
 
-from debug_toolbar.utils import get_name_from_obj
+from django.template import Engine, Template
+
+from debug_toolbar.utils import (
+    get_name_from_obj, get_template_context, get_template_source_from_source,
+)
 
 
 class GetNameFromObjTestCase(unittest.TestCase):
@@ -22,3 +28,42 @@ class GetNameFromObjTestCase(unittest.TestCase):
             pass
         res = get_name_from_obj(A)
         self.assertEqual(res, 'tests.test_utils.A')
+
+
+class ReloadCountingOrigin(object):
+    def __init__(self, name):
+        self.name = name
+        self.reloads = 0
+
+    def reload(self):
+        self.reloads += 1
+        with open(self.name) as f:
+            return f.read()
+
+
+class GetTemplateContextTestCase(unittest.TestCase):
+
+    def test_template_context_cached_per_node(self):
+        engine = Engine(debug=True)
+        template = Template('{% if foo %}\n{{ foo }}\n{% endif %}', engine=engine)
+        node = template.nodelist[0]
+        context = get_template_context(node, template)
+        self.assertEqual(context['context'][0]['num'], 1)
+        self.assertIs(get_template_context(node, template), context)
+
+    def test_template_source_cached_until_modified(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.html') as f:
+            f.write('first\nsecond\n')
+            f.flush()
+            origin = ReloadCountingOrigin(f.name)
+
+            line, source_lines, name = get_template_source_from_source((origin, (6, 12)))
+            self.assertEqual(line, 2)
+            self.assertEqual(source_lines[2], (2, 'second\n'))
+            get_template_source_from_source((origin, (0, 5)))
+            self.assertEqual(origin.reloads, 1)
+
+            stat = os.stat(f.name)
+            os.utime(f.name, (stat.st_atime, stat.st_mtime + 10))
+            get_template_source_from_source((origin, (0, 5)))
+            self.assertEqual(origin.reloads, 2)
@@ -2,9 +2,12 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import time
+
 from django.contrib.auth.models import User
 from django.http import HttpResponse
 from django.shortcuts import render
+from django.template.response import TemplateResponse
 from django.views.decorators.cache import cache_page
 
 
@@ -17,6 +20,18 @@ def regular_view(request, title):
     return render(request, 'basic.html', {'title': title})
 
 
+def template_response_view(request, title):
+    return TemplateResponse(request, 'basic.html', {'title': title})
+
+
+def busy_view(request):
+    # Keep the CPU busy long enough to be sampled.
+    end = time.time() + 0.05
+    while time.time() < end:
+        sum(range(100))
+    return HttpResponse()
+
+
 def new_user(request, username='joe'):
     User.objects.create_user(username=username)
     return render(request, 'basic.html', {'title': 'new user'})